@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in for the gnuplot executable used by the benchmarks.
+
+Commands are taken from "-e" or stdin and acknowledged without rendering anything. "print" output
+goes to stderr like in gnuplot, so GnuplotSession sentinels work, and every "set output" creates
+a small placeholder file. If PYGNUPLOT_FAKE_LOG is set, all received commands are appended to it.
+"""
+
+import re
+import sys
+import os
+
+_PRINT = re.compile(r'(?:^|;)\s*print\s+"([^"]*)"')
+_OUTPUT = re.compile(r'(?:^|;)\s*set\s+output\s+"([^"]+)"')
+_CD = re.compile(r'(?:^|;)\s*cd\s+"([^"]+)"')
+
+
+def handle(text, log):
+    if log is not None:
+        log.write(text)
+        log.write('\n')
+    for match in _CD.finditer(text):
+        os.chdir(match.group(1))
+    for match in _OUTPUT.finditer(text):
+        with open(match.group(1), 'wb') as file:
+            file.write(b'fake gnuplot output\n')
+    for match in _PRINT.finditer(text):
+        sys.stderr.write(match.group(1) + '\n')
+    sys.stderr.flush()
+    return
+
+
+def main(args):
+    log_path = os.environ.get('PYGNUPLOT_FAKE_LOG')
+    log = open(log_path, 'a') if log_path else None
+    try:
+        if '-e' in args:
+            handle(args[args.index('-e') + 1], log)
+            return 0
+        for line in sys.stdin:
+            if line.strip() == 'exit':
+                break
+            handle(line, log)
+    finally:
+        if log is not None:
+            log.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for pygnuplot.
+
+By default gnuplot is replaced by benchmarks/fake_gnuplot.py, so the results measure the Python
+side and the process spawn only. Use --real to benchmark against the gnuplot found on PATH.
+
+Example:
+    python benchmarks/run_benchmarks.py --output results.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+import pygnuplot
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def install_fake_gnuplot(directory):
+    """
+    Put an executable named gnuplot into directory that runs fake_gnuplot.py and prepend
+    directory to PATH.
+    """
+    fake_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_gnuplot.py')
+    if platform.system() == 'Windows':
+        launcher = os.path.join(directory, 'gnuplot.bat')
+        with open(launcher, 'w') as file:
+            file.write('@"{0}" "{1}" %*\n'.format(sys.executable, fake_script))
+    else:
+        launcher = os.path.join(directory, 'gnuplot')
+        with open(launcher, 'w') as file:
+            file.write('#!/bin/sh\nexec "{0}" "{1}" "$@"\n'.format(sys.executable, fake_script))
+        os.chmod(launcher, 0o755)
+    os.environ['PATH'] = directory + os.pathsep + os.environ.get('PATH', '')
+    return
+
+
+def write_datafile(path, rows=1000, columns=8):
+    with open(path, 'w') as file:
+        file.write('# benchmark data\n')
+        for row in range(rows):
+            file.write('\t'.join('{0:.6e}'.format(row * (column + 1)) for column in range(columns)))
+            file.write('\n')
+    return path
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def measure(func, repeat, operations=1):
+    """
+    Call func repeat times and return latency percentiles (seconds) and throughput (operations/s).
+    """
+    latencies = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {'repeat': repeat,
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'mean': statistics.mean(latencies),
+            'throughput': operations * repeat / sum(latencies)}
+
+
+def scenarios(workdir, series, image_size, batch_size):
+    datafile = write_datafile(os.path.join(workdir, 'data.dat'))
+
+    def xy_figure(num_series):
+        figure = pygnuplot.Figure(datafile=datafile, timeout=30)
+        figure.title = 'benchmark'
+        figure.xrange = [0, 1000]
+        for index in range(num_series):
+            figure.plot_xy(0, 1 + index % 7)
+        return figure
+
+    def build_xy():
+        xy_figure(series)._save_command([('out.png', 'png')])
+
+    yield 'build_plot_xy_{0:d}_series'.format(series), build_xy, 1
+
+    if np is not None:
+        image = np.random.default_rng(0).random((image_size, image_size))
+
+        def build_img():
+            figure = pygnuplot.Figure(timeout=30)
+            figure.xrange = [0, 100]
+            figure.yrange = [0, 100]
+            figure.plot_img(data=image, percentile_range=[1, 99])
+            figure._save_command([('img.png', 'png')])
+            figure.clear()
+
+        yield 'build_plot_img_{0:d}x{0:d}'.format(image_size), build_img, 1
+
+    for filetype in ('png', 'svg', 'pdf'):
+        figure = xy_figure(3)
+        yield ('save_figure_{0}'.format(filetype),
+               lambda figure=figure, filetype=filetype: figure.save_figure('out', filetype), 1)
+
+    figure = xy_figure(3)
+    yield ('save_figures_png_svg_pdf',
+           lambda: figure.save_figures(['multi.png', 'multi.svg', 'multi.pdf']), 1)
+
+    session = pygnuplot.GnuplotSession(persist=False)
+    session_figure = xy_figure(3)
+    session_figure.session = session
+    yield 'save_figure_png_session', lambda: session_figure.save_figure('session.png'), 1
+
+    figures = [xy_figure(3) for _ in range(batch_size)]
+    outputs = [os.path.join(workdir, 'batch_{0:d}.png'.format(index))
+               for index in range(batch_size)]
+
+    def batch():
+        for result in pygnuplot.render_batch(figures, outputs):
+            if result.error is not None:
+                raise result.error
+
+    yield 'render_batch_{0:d}'.format(batch_size), batch, batch_size
+    session.close()
+
+
+def compare(results, baseline, threshold):
+    """
+    Return descriptions of all benchmarks whose median latency regressed by more than threshold.
+    """
+    regressions = list()
+    for name, result in results.items():
+        reference = baseline.get('benchmarks', {}).get(name)
+        if reference is None or reference['p50'] <= 0:
+            continue
+        ratio = result['p50'] / reference['p50']
+        if ratio > 1 + threshold:
+            regressions.append('{0}: p50 {1:.3g}s vs baseline {2:.3g}s ({3:+.0%})'.format(
+                name, result['p50'], reference['p50'], ratio - 1))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--real', action='store_true', help='Use the gnuplot found on PATH')
+    parser.add_argument('--repeat', type=int, default=20, help='Repetitions per benchmark')
+    parser.add_argument('--series', type=int, default=500, help='Series in plot_xy benchmark')
+    parser.add_argument('--image-size', type=int, default=2000, help='Edge of image benchmark')
+    parser.add_argument('--batch-size', type=int, default=32, help='Figures in batch benchmark')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed relative p50 slowdown against the baseline')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='pygnuplot_bench_')
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        if args.real:
+            if shutil.which('gnuplot') is None:
+                parser.error('--real needs gnuplot on PATH.')
+        else:
+            install_fake_gnuplot(workdir)
+
+        results = dict()
+        for name, func, operations in scenarios(workdir, args.series, args.image_size,
+                                                args.batch_size):
+            results[name] = measure(func, args.repeat, operations)
+            print('{0:<32s} p50 {1[p50]:9.4f}s  p90 {1[p90]:9.4f}s  p99 {1[p99]:9.4f}s  '
+                  '{1[throughput]:10.1f} ops/s'.format(name, results[name]))
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'gnuplot': 'real' if args.real else 'fake',
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'benchmarks': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,7 +5,31 @@
 
 import subprocess
 import platform
+import threading
+import queue
+import time
+import re
+import sys
 import os
+import tempfile
+import weakref
+import collections
+import concurrent.futures
+import asyncio
+import hashlib
+import shutil
+import stat
+import logging
+import socket
+import struct
+import json
+import bisect
+import warnings
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 if platform.system() == 'Linux':
     default_terminal = 'x11'
@@ -14,22 +38,791 @@ elif platform.system() == 'Darwin':
 else:
     default_terminal = 'wxt'
 
+_logger = logging.getLogger(__name__)
+
+# Timings and results of a single gnuplot run as reported to run hooks. Times are in seconds and
+# None if the phase was not measured (e.g. spawn_time and first_byte_time in session mode).
+RunEvent = collections.namedtuple('RunEvent',
+                                  ['command_size', 'build_time', 'spawn_time', 'first_byte_time',
+                                   'total_time', 'returncode', 'stderr_size', 'output_size',
+                                   'session', 'error'])
+_run_hooks = list()
+
+
+def add_run_hook(callback):
+    """
+    Register callback to be called with a RunEvent after every gnuplot run of any Figure.
+    Timing is only collected while at least one hook is registered.
+    """
+    if not callable(callback):
+        raise TypeError('Run hook must be callable. Received "{0}" instead.'.format(type(callback)))
+    _run_hooks.append(callback)
+    return
+
+
+def remove_run_hook(callback):
+    _run_hooks.remove(callback)
+    return
+
+
+def _emit_run_event(event):
+    for callback in list(_run_hooks):
+        try:
+            callback(event)
+        except Exception:
+            _logger.exception('Run hook %r failed.', callback)
+    return
+
+
+def _output_size(outputs):
+    size = 0
+    for path in outputs:
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+    return size
+
+
+# Maximum number of gnuplot processes started concurrently by Figure.run_async per event loop
+max_async_renders = os.cpu_count() or 1
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+def _async_render_semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _async_semaphores[loop] = asyncio.Semaphore(max_async_renders)
+    return semaphore
+
+
+# Metadata of a datafile as detected by datafile_info
+DatafileInfo = collections.namedtuple('DatafileInfo',
+                                      ['num_columns', 'header', 'row_estimate', 'byte_size'])
+# Cache of datafile metadata. Maps absolute path to (mtime_ns, byte_size, DatafileInfo).
+_datafile_cache = dict()
+# Sparse row indices of datafiles. Maps absolute path to DatafileIndex.
+_datafile_index_cache = dict()
+# Shape, value range and values at evenly spaced percentiles (None unless requested) of an image
+# as computed by Figure._image_stats
+ImageStats = collections.namedtuple('ImageStats', ['shape', 'min', 'max', 'quantiles'])
+# Cache of image statistics. Maps absolute path to (mtime_ns, byte_size, ImageStats), least
+# recently used first.
+_image_stats_cache = collections.OrderedDict()
+_IMAGE_STATS_CACHE_SIZE = 256
+# SHA-256 of the temporary data files written by Figures. They never change once written, so the
+# render cache identifies them by this digest. Maps path to hex digest.
+_tempfile_digests = dict()
+
+
+def datafile_info(filepath):
+    """
+    Return the DatafileInfo of a whitespace separated datafile.
+
+    Only the leading comment lines and the first data row are read. The result is cached until
+    the modification time or size of the file changes.
+
+    @param str filepath: Path to the datafile
+    @return DatafileInfo: column count, header comment lines, estimated row count and byte size
+    """
+    path = os.path.abspath(filepath)
+    file_stat = os.stat(path)
+    cached = _datafile_cache.get(path)
+    if cached is not None and cached[0] == file_stat.st_mtime_ns and cached[1] == file_stat.st_size:
+        return cached[2]
+
+    num_cols = 0
+    header = list()
+    header_bytes = 0
+    row_bytes = 0
+    with open(path, 'rb') as file:
+        for raw_line in file:
+            line = raw_line.decode('utf-8', errors='replace')
+            if line.startswith('#'):
+                header.append(line.rstrip('\r\n'))
+            elif line.strip():
+                num_cols = len(line.strip().split())
+                row_bytes = len(raw_line)
+                break
+            header_bytes += len(raw_line)
+    row_estimate = (file_stat.st_size - header_bytes) // row_bytes if row_bytes else 0
+
+    info = DatafileInfo(num_cols, tuple(header), row_estimate, file_stat.st_size)
+    _datafile_cache[path] = (file_stat.st_mtime_ns, file_stat.st_size, info)
+    return info
+
+
+class DatafileIndex:
+    """
+    Sparse index of an append-only datafile sorted by its first column.
+
+    The byte offset and x value of every step-th data row are kept. Rows appended to the file
+    are indexed by update without reading the file again. If the file shrinks or its beginning
+    changes, the index is rebuilt.
+    """
+    _HEAD_BYTES = 4096
+
+    def __init__(self, filepath, step=1024):
+        """
+        @param str filepath: Path to a whitespace separated datafile
+        @param int step: Number of data rows between two indexed rows
+        """
+        if not isinstance(step, int) or step < 1:
+            raise ValueError('DatafileIndex.step must be a positive int. Received "{0}" instead.'
+                             ''.format(step))
+        self.__path = os.path.abspath(filepath)
+        self.__step = step
+        self.__lock = threading.Lock()
+        self._reset()
+        self.update()
+
+    def _reset(self):
+        self.__offsets = list()
+        self.__xs = list()
+        self.__num_rows = 0
+        self.__end = 0
+        self.__last_x = None
+        self.__sorted = True
+        self.__head = b''
+        return
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def step(self):
+        return self.__step
+
+    @property
+    def num_rows(self):
+        return self.__num_rows
+
+    @property
+    def byte_size(self):
+        # Number of bytes of the file covered by the index
+        return self.__end
+
+    @property
+    def is_sorted(self):
+        return self.__sorted
+
+    @staticmethod
+    def _parse_x(raw_line):
+        fields = raw_line.split(None, 1)
+        if not fields or fields[0].startswith(b'#'):
+            return None
+        try:
+            return float(fields[0])
+        except ValueError:
+            return None
+
+    def update(self):
+        """
+        Index the rows appended since the last update. Incomplete last lines are left for later.
+        """
+        with self.__lock:
+            with open(self.__path, 'rb') as file:
+                size = os.fstat(file.fileno()).st_size
+                head = file.read(min(len(self.__head), size))
+                if size < self.__end or head != self.__head:
+                    self._reset()
+                if size == self.__end:
+                    return
+                if len(self.__head) < self._HEAD_BYTES:
+                    file.seek(0)
+                    self.__head = file.read(self._HEAD_BYTES)
+                offset = self.__end
+                file.seek(offset)
+                for raw_line in file:
+                    if not raw_line.endswith(b'\n'):
+                        break
+                    x = self._parse_x(raw_line)
+                    if x is not None:
+                        if self.__last_x is not None and x < self.__last_x:
+                            self.__sorted = False
+                        if self.__num_rows % self.__step == 0:
+                            self.__offsets.append(offset)
+                            self.__xs.append(x)
+                        self.__num_rows += 1
+                        self.__last_x = x
+                    offset += len(raw_line)
+                self.__end = offset
+        return
+
+    def byte_range(self, xmin, xmax):
+        """
+        Byte range of the file holding all indexed rows with xmin <= x <= xmax. It may hold up to
+        step rows before and after the window as well.
+
+        @return tuple: (start offset, end offset)
+        """
+        if not self.__sorted:
+            raise ValueError('Datafile "{0}" is not sorted by its first column.'
+                             ''.format(self.__path))
+        with self.__lock:
+            first = bisect.bisect_left(self.__xs, xmin) - 1
+            last = bisect.bisect_right(self.__xs, xmax)
+            start = self.__offsets[first] if first >= 0 else 0
+            end = self.__offsets[last] if last < len(self.__offsets) else self.__end
+        return start, end
+
+    def window_rows(self, xmin, xmax):
+        """
+        Yield the raw data rows with xmin <= x <= xmax. Only the byte range of the window is read.
+        """
+        start, end = self.byte_range(xmin, xmax)
+        with open(self.__path, 'rb') as file:
+            file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                raw_line = file.readline(remaining)
+                if not raw_line:
+                    break
+                remaining -= len(raw_line)
+                x = self._parse_x(raw_line)
+                if x is not None and xmin <= x <= xmax:
+                    yield raw_line
+        return
+
+
+def datafile_index(filepath, step=1024):
+    """
+    Return the DatafileIndex of a datafile, updated with the rows appended since the last call.
+    Indices are kept for the lifetime of the process.
+
+    @param str filepath: Path to the datafile
+    @param int step: Number of data rows between two indexed rows
+    @return DatafileIndex: Up to date index of the file
+    """
+    path = os.path.abspath(filepath)
+    index = _datafile_index_cache.get(path)
+    if index is None or index.step != step:
+        index = _datafile_index_cache[path] = DatafileIndex(path, step=step)
+    else:
+        index.update()
+    return index
+
+
+class ImagePyramid:
+    """
+    Reduced resolution copies of an image. Level n has 2**n times fewer rows and columns than
+    the image, every pixel being the mean or maximum of a block of the level before. Non-finite
+    values are ignored.
+
+    Pyramids of image files are stored as float32 .npy files next to the source and reused until
+    the source changes. Stored levels are memory-mapped, so cropping a level reads only the rows
+    it needs.
+    """
+    _REDUCTIONS = ('mean', 'max')
+    # Levels are added until both dimensions are at most this size
+    _MIN_SIZE = 256
+
+    def __init__(self, shape, levels, paths, reduction='mean'):
+        """
+        @param tuple shape: Shape of the full resolution image (level 0)
+        @param list levels: Arrays of the reduced levels 1, 2, ...
+        @param list paths: .npy file of every reduced level or None for in-memory levels
+        @param str reduction: mean or max
+        """
+        self.__shape = tuple(shape)
+        self.__levels = tuple(levels)
+        self.__paths = tuple(paths)
+        self.__reduction = reduction
+
+    @property
+    def shape(self):
+        return self.__shape
+
+    @property
+    def reduction(self):
+        return self.__reduction
+
+    @property
+    def num_levels(self):
+        return len(self.__levels) + 1
+
+    def level(self, index):
+        """
+        @return tuple: (array, .npy path or None) of reduced level index >= 1
+        """
+        if not 1 <= index < self.num_levels:
+            raise ValueError('ImagePyramid has no reduced level {0:d}.'.format(index))
+        return self.__levels[index - 1], self.__paths[index - 1]
+
+    def level_for(self, num_pixels, num_rows=None, num_columns=None):
+        """
+        Coarsest level still showing at least num_pixels pixels along the longer side of a crop
+        of num_rows x num_columns full resolution pixels (default: the whole image).
+        """
+        extent = max(self.__shape[0] if num_rows is None else num_rows,
+                     self.__shape[1] if num_columns is None else num_columns)
+        index = 0
+        while index + 1 < self.num_levels and extent / 2 ** (index + 1) >= num_pixels:
+            index += 1
+        return index
+
+    @classmethod
+    def _check_reduction(cls, reduction):
+        if reduction not in cls._REDUCTIONS:
+            raise ValueError('Invalid image reduction "{0}". Allowed reductions are: {1}.'
+                             ''.format(reduction, ', '.join(cls._REDUCTIONS)))
+        return
+
+    @staticmethod
+    def _reduced_shape(shape):
+        return (shape[0] + 1) // 2, (shape[1] + 1) // 2
+
+    @staticmethod
+    def _reduce(image, reduction, out, chunk_bytes=1 << 24):
+        """
+        Write the 2x2 block mean or maximum of image into out, streaming image in row chunks.
+        """
+        rows = max(2, chunk_bytes // max(1, abs(image.strides[0])) // 2 * 2)
+        for start in range(0, image.shape[0], rows):
+            block = np.array(image[start:start + rows], dtype=np.float64)
+            block[~np.isfinite(block)] = np.nan
+            if block.shape[0] % 2 or block.shape[1] % 2:
+                block = np.pad(block, ((0, block.shape[0] % 2), (0, block.shape[1] % 2)),
+                               constant_values=np.nan)
+            blocks = block.reshape(block.shape[0] // 2, 2, block.shape[1] // 2, 2)
+            # Blocks without any finite value stay NaN
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                if reduction == 'mean':
+                    reduced = np.nanmean(blocks, axis=(1, 3))
+                else:
+                    reduced = np.nanmax(blocks, axis=(1, 3))
+            out[start // 2:start // 2 + reduced.shape[0]] = reduced
+        return
+
+    @classmethod
+    def from_array(cls, image, reduction='mean'):
+        """
+        Build an in-memory pyramid of a 2D array.
+        """
+        if np is None:
+            raise ImportError('ImagePyramid requires numpy.')
+        cls._check_reduction(reduction)
+        levels = list()
+        previous = image
+        while max(previous.shape) > cls._MIN_SIZE:
+            level = np.empty(cls._reduced_shape(previous.shape), dtype=np.float32)
+            cls._reduce(previous, reduction, level)
+            levels.append(level)
+            previous = level
+        return cls(image.shape, levels, [None] * len(levels), reduction)
+
+    @classmethod
+    def from_file(cls, filepath, load_image, reduction='mean'):
+        """
+        Load the stored pyramid of an image file or build and store it if it is missing or
+        outdated. load_image is only called to build the pyramid.
+
+        @param str filepath: Path to the image file
+        @param callable load_image: Returns the full resolution image as 2D array
+        @param str reduction: mean or max
+        """
+        if np is None:
+            raise ImportError('ImagePyramid requires numpy.')
+        cls._check_reduction(reduction)
+        path = os.path.abspath(filepath)
+        file_stat = os.stat(path)
+        meta_path = '{0}.mip_{1}.json'.format(path, reduction)
+        try:
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            if meta['mtime_ns'] == file_stat.st_mtime_ns and meta['size'] == file_stat.st_size:
+                levels = [np.load(level_path, mmap_mode='r') for level_path in meta['levels']]
+                return cls(meta['shape'], levels, meta['levels'], reduction)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        image = load_image()
+        levels, paths = list(), list()
+        previous = image
+        while max(previous.shape) > cls._MIN_SIZE:
+            level_path = '{0}.mip_{1}_{2:d}.npy'.format(path, reduction, len(levels) + 1)
+            level = np.lib.format.open_memmap(level_path, mode='w+', dtype=np.float32,
+                                              shape=cls._reduced_shape(previous.shape))
+            cls._reduce(previous, reduction, level)
+            level.flush()
+            levels.append(level)
+            paths.append(level_path.replace('\\', '/'))
+            previous = level
+        # The metadata is written last, so an interrupted build is redone next time
+        with open(meta_path, 'w') as file:
+            json.dump({'mtime_ns': file_stat.st_mtime_ns, 'size': file_stat.st_size,
+                       'shape': list(image.shape), 'levels': paths}, file)
+        return cls(image.shape, levels, paths, reduction)
+
+
+class RenderCache:
+    """
+    Content-addressed store of rendered figure files with least-recently-used eviction.
+
+    Files are stored as "<key>.<filetype>" in directory, which may be shared between processes.
+    The total size of the stored files is kept below max_bytes.
+    """
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024):
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), 'pygnuplot_cache')
+        os.makedirs(directory, exist_ok=True)
+        self.__directory = directory
+        self.__max_bytes = int(max_bytes)
+        self.__entries = collections.OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Pick up files of earlier runs, least recently used first
+        stored = list()
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                file_stat = entry.stat()
+                stored.append((file_stat.st_mtime, entry.name, file_stat.st_size))
+        for _, name, size in sorted(stored):
+            self.__entries[name] = size
+            self.__size += size
+        with self.__lock:
+            self._evict()
+
+    @property
+    def directory(self):
+        return self.__directory
+
+    @property
+    def max_bytes(self):
+        return self.__max_bytes
+
+    @property
+    def size(self):
+        return self.__size
+
+    @staticmethod
+    def key(command, files=()):
+        """
+        Hash a command string together with the modification time and size of the files it reads.
+
+        @param str command: Command string without the output filename
+        @param iterable files: Paths of datafiles referenced by command
+        @return str: Hex digest used as cache key
+        """
+        digest = hashlib.sha256(command.encode('utf-8'))
+        for path in files:
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            digest.update('\0{0}\0{1:d}\0{2:d}'.format(os.path.abspath(path), file_stat.st_mtime_ns,
+                                                       file_stat.st_size).encode('utf-8'))
+        return digest.hexdigest()
+
+    def fetch(self, key, filetype, destination):
+        """
+        Copy the stored output for key to destination.
+
+        @return bool: True on a cache hit, False otherwise
+        """
+        name = '{0}.{1}'.format(key, filetype)
+        with self.__lock:
+            if name not in self.__entries:
+                self.misses += 1
+                return False
+            self.__entries.move_to_end(name)
+            self.hits += 1
+        path = os.path.join(self.__directory, name)
+        try:
+            shutil.copyfile(path, destination)
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            with self.__lock:
+                self.__size -= self.__entries.pop(name, 0)
+                self.hits -= 1
+                self.misses += 1
+            return False
+        return True
+
+    def store(self, key, filetype, source):
+        """
+        Store a copy of the rendered file source under key.
+        """
+        name = '{0}.{1}'.format(key, filetype)
+        size = os.path.getsize(source)
+        if size > self.__max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.__directory, prefix='.tmp_')
+        os.close(fd)
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, os.path.join(self.__directory, name))
+        with self.__lock:
+            self.__size += size - self.__entries.pop(name, 0)
+            self.__entries[name] = size
+            self._evict()
+        return
+
+    def _evict(self):
+        while self.__size > self.__max_bytes and self.__entries:
+            name, size = self.__entries.popitem(last=False)
+            self.__size -= size
+            try:
+                os.remove(os.path.join(self.__directory, name))
+            except OSError:
+                pass
+        return
+
+    def clear(self):
+        with self.__lock:
+            for name in self.__entries:
+                try:
+                    os.remove(os.path.join(self.__directory, name))
+                except OSError:
+                    pass
+            self.__entries.clear()
+            self.__size = 0
+            self.hits = 0
+            self.misses = 0
+        return
+
+
+class GnuplotSession:
+    """
+    Long-lived gnuplot process that receives commands through its stdin pipe.
+
+    Completion of each command is detected by a sentinel that gnuplot prints to stderr after the
+    command has been processed. Everything gnuplot writes to stderr before the sentinel is
+    attributed to that command. If the process dies it is restarted on the next command.
+    """
+    _SENTINEL = '__PYGNUPLOT_DONE_{0:d}__'
+    _ERROR_PATTERN = re.compile(r'^\s*(?:"[^"]*",\s*)?line \d+:(?!\s*warning)', re.IGNORECASE)
+
+    def __init__(self, executable='gnuplot', persist=True, reset=True):
+        self.__executable = executable
+        self.__persist = bool(persist)
+        self.__reset = bool(reset)
+        self.__proc = None
+        self.__stderr_queue = None
+        self.__stdout_chunks = None
+        self.__counter = 0
+        self.__restarts = -1
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @property
+    def args(self):
+        return [self.__executable, '-p'] if self.__persist else [self.__executable]
+
+    @property
+    def reset(self):
+        return self.__reset
+
+    @reset.setter
+    def reset(self, do_reset):
+        if isinstance(do_reset, bool):
+            self.__reset = do_reset
+        return
+
+    @property
+    def restarts(self):
+        return max(self.__restarts, 0)
+
+    @property
+    def is_alive(self):
+        return self.__proc is not None and self.__proc.poll() is None
+
+    def start(self):
+        """
+        Start the gnuplot process if it is not running already.
+        """
+        if self.is_alive:
+            return
+        self.__proc = subprocess.Popen(self.args, shell=False, stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.__stderr_queue = queue.Queue()
+        self.__stdout_chunks = []
+        self.__restarts += 1
+        threading.Thread(target=self._read_stderr, args=(self.__proc, self.__stderr_queue),
+                         daemon=True).start()
+        threading.Thread(target=self._read_stdout, args=(self.__proc, self.__stdout_chunks),
+                         daemon=True).start()
+        return
+
+    @staticmethod
+    def _read_stderr(proc, line_queue):
+        for line in iter(proc.stderr.readline, b''):
+            line_queue.put(line.decode('utf-8', errors='replace'))
+        # None marks the end of the stream, i.e. the process has died
+        line_queue.put(None)
+
+    @staticmethod
+    def _read_stdout(proc, chunks):
+        for chunk in iter(lambda: proc.stdout.read1(65536), b''):
+            chunks.append(chunk)
+
+    def run(self, cmd, timeout=None, reset=None):
+        """
+        Send cmd to the gnuplot process and wait until it has been processed.
+
+        @param str cmd: The command to be run with gnuplot
+        @param float timeout: Seconds to wait for the command to finish. None waits forever.
+        @param bool reset: Reset gnuplot before cmd. None uses GnuplotSession.reset.
+        @return subprocess.CompletedProcess: Result with the stderr output of this command
+        """
+        with self.__lock:
+            self.start()
+            self.__counter += 1
+            sentinel = self._SENTINEL.format(self.__counter)
+            if self.__reset if reset is None else reset:
+                prefix = 'reset;cd "{0}";'.format(os.getcwd().replace('\\', '/'))
+            else:
+                prefix = ''
+            try:
+                self.__proc.stdin.write('{0}{1}\nset print;print "{2}"\n'.format(
+                    prefix, cmd, sentinel).encode('utf-8'))
+                self.__proc.stdin.flush()
+            except (BrokenPipeError, OSError):
+                self.kill()
+                raise ChildProcessError('gnuplot session terminated unexpectedly.')
+
+            deadline = None if timeout is None else time.monotonic() + timeout
+            stderr_lines = []
+            while True:
+                try:
+                    if deadline is None:
+                        line = self.__stderr_queue.get()
+                    else:
+                        line = self.__stderr_queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    self.kill()
+                    raise subprocess.TimeoutExpired(self.args, timeout,
+                                                    stderr=''.join(stderr_lines))
+                if line is None:
+                    self.kill()
+                    raise ChildProcessError(''.join(stderr_lines))
+                if line.strip() == sentinel:
+                    break
+                stderr_lines.append(line)
+
+            stderr = ''.join(stderr_lines)
+            stdout = b''.join(self.__stdout_chunks[:]).decode('utf-8', errors='replace')
+            self.__stdout_chunks.clear()
+            if any(self._ERROR_PATTERN.match(line) for line in stderr_lines):
+                raise ChildProcessError(stderr)
+            return subprocess.CompletedProcess(self.args, 0, stdout=stdout, stderr=stderr)
+
+    def kill(self):
+        """
+        Kill the gnuplot process. It will be restarted by the next call to run.
+        """
+        if self.__proc is not None:
+            if self.__proc.poll() is None:
+                self.__proc.kill()
+            self.__proc.wait()
+            self.__proc = None
+        return
+
+    def close(self, timeout=5):
+        """
+        Ask gnuplot to exit and kill it if it does not comply within timeout seconds.
+        """
+        with self.__lock:
+            if self.is_alive:
+                try:
+                    self.__proc.stdin.write(b'exit\n')
+                    self.__proc.stdin.close()
+                    self.__proc.wait(timeout=timeout)
+                except (BrokenPipeError, OSError, subprocess.TimeoutExpired):
+                    pass
+            self.kill()
+        return
+
+
+class XYSeries:
+    """
+    A single XY data series of a Figure as added by Figure.plot_xy.
+
+    Column indices are zero-based. The attributes can be changed until the figure is rendered.
+    """
+    __slots__ = ('source', 'x', 'y', 'xerror', 'yerror', 'xscale', 'yscale', 'linestyle', 'title')
+
+    def __init__(self, source, x, y, xerror=None, yerror=None, xscale=1, yscale=1, linestyle=1,
+                 title=''):
+        self.source = source
+        self.x = x
+        self.y = y
+        self.xerror = xerror
+        self.yerror = yerror
+        self.xscale = xscale
+        self.yscale = yscale
+        self.linestyle = linestyle
+        self.title = title
+
+    def __repr__(self):
+        return 'XYSeries({0})'.format(', '.join('{0}={1!r}'.format(name, getattr(self, name))
+                                                for name in self.__slots__))
+
+    def render(self):
+        """
+        @return str: The plot command elements of this series, error bars first
+        """
+        columns = dict(SOURCE=self.source, TITLE=self.title, X=self.x + 1, Y=self.y + 1,
+                       XSCALE=self.xscale, YSCALE=self.yscale)
+        line = Figure._PLOT_XY_LP_DASHED.format(LS=self.linestyle, **columns)
+        if self.xerror is not None and self.yerror is not None:
+            errors = Figure._PLOT_XY_XYERR.format(XE=self.xerror + 1, YE=self.yerror + 1,
+                                                  LS=self.linestyle + 1, **columns)
+        elif self.xerror is not None:
+            errors = Figure._PLOT_XY_XERR.format(XE=self.xerror + 1, LS=self.linestyle + 1,
+                                                 **columns)
+        elif self.yerror is not None:
+            errors = Figure._PLOT_XY_YERR.format(YE=self.yerror + 1, LS=self.linestyle + 1,
+                                                 **columns)
+        else:
+            return line
+        return '{0}, {1}'.format(errors, line)
+
+
+class _ImagePlot(str):
+    """
+    Plot command string of an image added by Figure.plot_img.
+    """
+    __slots__ = ()
+
 
 class Figure:
     # Plot command templates to be chained together if necessary
-    _PLOT_XY_SCATTER = '"{FILE}" u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}) ls {LS:d} title "{TITLE}"'
-    _PLOT_XY_LINE = '"{FILE}" u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}) w l ls {LS:d} title "{TITLE}"'
-    _PLOT_XY_LP = '"{FILE}" u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}) w lp ls {LS:d} title "{TITLE}"'
-    _PLOT_XY_LP_DASHED = '"{FILE}" u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}) w lp ls {LS:d} dt 3 ' \
+    _PLOT_XY_SCATTER = '{SOURCE} u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}) ls {LS:d} title "{TITLE}"'
+    _PLOT_XY_LINE = '{SOURCE} u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}) w l ls {LS:d} title "{TITLE}"'
+    _PLOT_XY_LP = '{SOURCE} u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}) w lp ls {LS:d} title "{TITLE}"'
+    _PLOT_XY_LP_DASHED = '{SOURCE} u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}) w lp ls {LS:d} dt 3 ' \
                          'title "{TITLE}"'
-    _PLOT_XY_XYERR = '"{FILE}" u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}):{XE:d}:{YE:d} w xyerrorbars ' \
+    _PLOT_XY_XYERR = '{SOURCE} u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}):{XE:d}:{YE:d} w xyerrorbars ' \
                      'ls {LS:d} pt -1 notitle'
-    _PLOT_XY_XERR = '"{FILE}" u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}):{XE:d} w xerrorbars ls {LS:d}' \
+    _PLOT_XY_XERR = '{SOURCE} u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}):{XE:d} w xerrorbars ls {LS:d}' \
                     ' pt -1 notitle'
-    _PLOT_XY_YERR = '"{FILE}" u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}):{YE:d} w yerrorbars ls {LS:d}' \
+    _PLOT_XY_YERR = '{SOURCE} u (${X:d}*{XSCALE}):(${Y:d}*{YSCALE}):{YE:d} w yerrorbars ls {LS:d}' \
                     ' pt -1 notitle'
-    _PLOT_IMG = '"{FILE}" u (($1*({XMAX}-{XMIN})/(STATS_size_x-1))+{XMIN}):' \
-                '(($2*({YMAX}-{YMIN})/(STATS_size_y-1))+{YMIN}):3 matrix w image title ""'
+    _PLOT_IMG = '"{FILE}" u (($1*({XMAX}-{XMIN})/({NX}-1))+{XMIN}):' \
+                '(($2*({YMAX}-{YMIN})/({NY}-1))+{YMIN}):3 matrix w image title ""'
+    _PLOT_IMG_BINARY = '"{FILE}" binary array=({NX:d},{NY:d}) {SPEC} dx={DX} dy={DY} ' \
+                       'origin=({XMIN},{YMIN}) w image title ""'
+    _BINARY_FORMATS = {'f4': '%float32', 'f8': '%float64'}
+
+    # Width in pixels of the png and svg terminals if no size is given
+    _DEFAULT_TERMINAL_WIDTH = 640
+
+    _AUTO_LABEL = 'Data {0:d}'
+    _AUTO_LABEL_PATTERN = re.compile(r'title "Data (\d+)"')
+    _QUOTED_PATTERN = re.compile(r'"([^"]*)"|\'([^\']*)\'')
 
     _SET_TITLE = 'set title "{TITLE}";'
     _SET_XRANGE = 'set xrange [{MIN}:{MAX}];'
@@ -37,16 +830,32 @@ class Figure:
     _SET_XLABEL = 'set xlabel "{LABEL}" offset 0,0.5;'
     _SET_YLABEL = 'set ylabel "{LABEL}" offset 1.25,0;'
 
-    def __init__(self, datafile=None, use_default_style=False, timeout=None):
+    def __init__(self, datafile=None, use_default_style=False, timeout=None, session=None,
+                 render_cache=None):
         self.__config_command = ''
         self.__user_command = ''
-        self.__plot_command = ''
+        # Plot elements in order. Either XYSeries or plain command strings.
+        self.__plots = list()
+        self.__titles = collections.Counter()
+        self.__label_counter = 1
         self.__timeout = timeout
+        self.__session = None
+        self.session = session
+        self.__render_cache = None
+        self.render_cache = render_cache
+        self.__render_client = None
         self.__present_plots = 0
+        self.__binary_files = dict()
+        self.__tempfiles = list()
+        self.__source_files = list()
+        # (series, path, columns, num_buckets, xrange) of datafile series still to be decimated
+        self.__pending_decimation = list()
+        weakref.finalize(self, self._remove_files, self.__tempfiles)
         self._datafile = datafile if datafile is None else os.path.basename(datafile)
         self._datadir = datafile if datafile is None else os.path.abspath(
             os.path.join(datafile, os.pardir)).replace('\\', '/')
         self._use_default_style = bool(use_default_style)
+        self._decimate = None
         self._font = None
         self._font_size = None
         self._title = None
@@ -65,6 +874,46 @@ class Figure:
             self.__timeout = None
         return
 
+    @property
+    def session(self):
+        return self.__session
+
+    @session.setter
+    def session(self, new_session):
+        if new_session is None or isinstance(new_session, GnuplotSession):
+            self.__session = new_session
+        else:
+            raise TypeError('Figure.session must be of type GnuplotSession or None. Received "{0}" '
+                            'instead.'.format(type(new_session)))
+
+    @property
+    def render_cache(self):
+        return self.__render_cache
+
+    @render_cache.setter
+    def render_cache(self, cache):
+        if cache is None or isinstance(cache, RenderCache):
+            self.__render_cache = cache
+        else:
+            raise TypeError('Figure.render_cache must be of type RenderCache or None. Received '
+                            '"{0}" instead.'.format(type(cache)))
+
+    @property
+    def render_client(self):
+        return self.__render_client
+
+    @render_client.setter
+    def render_client(self, client):
+        """
+        Render save_figure, save_figures and render_bytes on a RenderServer instead of a local
+        gnuplot process.
+        """
+        if client is None or isinstance(client, RenderClient):
+            self.__render_client = client
+        else:
+            raise TypeError('Figure.render_client must be of type RenderClient or None. Received '
+                            '"{0}" instead.'.format(type(client)))
+
     @property
     def use_default_style(self):
         return self._use_default_style
@@ -75,6 +924,26 @@ class Figure:
             self._use_default_style = use_default
         return
 
+    @property
+    def decimate(self):
+        return self._decimate
+
+    @decimate.setter
+    def decimate(self, width):
+        """
+        Reduce every following plot_xy series to the min/max points of width x-buckets.
+        True uses the default terminal width, None or False disables decimation.
+        """
+        if width is None or width is False:
+            self._decimate = None
+        elif width is True:
+            self._decimate = self._DEFAULT_TERMINAL_WIDTH
+        elif isinstance(width, int) and width > 0:
+            self._decimate = width
+        else:
+            raise TypeError('Figure.decimate must be a positive int, bool or None. Received "{0}" '
+                            'instead.'.format(width))
+
     @property
     def font(self):
         return self._font
@@ -221,12 +1090,7 @@ class Figure:
             raise FileNotFoundError('Tried to set a non-existent filepath "{0}" in Figure.datafile.'
                                     ''.format(filepath))
 
-        num_cols = 0
-        with open(filepath, 'r') as file:
-            for line in file.readlines():
-                if not line.startswith('#'):
-                    num_cols = len(line.strip().split())
-                    break
+        num_cols = datafile_info(filepath).num_columns
         if num_cols < 1:
             raise ValueError('0 columns detected in datafile "{0}".'.format(filepath))
 
@@ -234,6 +1098,262 @@ class Figure:
         self._datadir = os.path.abspath(os.path.join(filepath, os.pardir)).replace('\\', '/')
         return
 
+    @staticmethod
+    def _remove_files(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            _tempfile_digests.pop(path, None)
+        paths.clear()
+        return
+
+    def _binary_file(self, data):
+        """
+        Write an array once as raw float64 into a temporary file and return its path.
+        Arrays with the same content reuse the already written file, so arrays changed in place
+        after plotting get a new file.
+        """
+        if np is None:
+            raise ImportError('Plotting in-memory arrays requires numpy.')
+        array = np.ascontiguousarray(data, dtype=np.float64)
+        digest = hashlib.sha256(array.data).hexdigest()
+        path = self.__binary_files.get(digest)
+        if path is None:
+            path = self.__binary_files[digest] = self._write_binary(array)
+            self.__tempfiles.append(path)
+            _tempfile_digests[path] = digest
+        return path
+
+    def _window_file(self, xwindow):
+        """
+        Copy the rows of Figure.datafile within xwindow into a temporary file and return its path.
+        """
+        if len(xwindow) != 2:
+            raise TypeError('Figure.plot_xy xwindow must be an iterable of length 2. Received '
+                            '"{0}" instead.'.format(xwindow))
+        if self._datafile is None:
+            raise ValueError('Figure.plot_xy xwindow needs Figure.datafile to be set.')
+        index = datafile_index(self.datafile)
+        fd, path = tempfile.mkstemp(prefix='pygnuplot_', suffix='.dat')
+        num_rows = 0
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for row in index.window_rows(min(xwindow), max(xwindow)):
+                    file.write(row)
+                    digest.update(row)
+                    num_rows += 1
+            if num_rows == 0:
+                raise ValueError('No rows of datafile "{0}" lie within xwindow {1}.'.format(
+                    self.datafile, list(xwindow)))
+        except Exception:
+            os.remove(path)
+            raise
+        path = path.replace('\\', '/')
+        self.__tempfiles.append(path)
+        _tempfile_digests[path] = digest.hexdigest()
+        return path
+
+    @staticmethod
+    def _write_binary(data):
+        array = np.ascontiguousarray(data, dtype=np.float64)
+        fd, path = tempfile.mkstemp(prefix='pygnuplot_', suffix='.bin')
+        with os.fdopen(fd, 'wb') as file:
+            array.tofile(file)
+        return path.replace('\\', '/')
+
+    @classmethod
+    def _map_image_file(cls, filepath, shape=None, dtype=None):
+        """
+        Memory-map a float32/float64 image from a .npy file or a raw binary file.
+        Raw files need the shape (rows, columns) and dtype (default float64) to be given.
+
+        @return tuple: (numpy.memmap, gnuplot binary spec reading the file in place)
+        """
+        if np is None:
+            raise ImportError('Plotting binary image files requires numpy.')
+        if not os.path.exists(filepath):
+            raise FileNotFoundError('Tried to plot a non-existent image file "{0}".'
+                                    ''.format(filepath))
+        if filepath.lower().endswith('.npy'):
+            image = np.load(filepath, mmap_mode='r')
+            if image.ndim == 2 and not image.flags.c_contiguous:
+                raise ValueError('Fortran ordered image file "{0}" is not supported. Save it in C '
+                                 'order instead.'.format(filepath))
+        elif shape is None:
+            raise ValueError('The shape of raw binary image file "{0}" must be given.'
+                             ''.format(filepath))
+        else:
+            image = np.memmap(filepath, dtype=np.float64 if dtype is None else dtype, mode='r',
+                              shape=tuple(shape))
+        if image.ndim != 2:
+            raise ValueError('Image file "{0}" must contain a 2D array. Found shape {1} instead.'
+                             ''.format(filepath, image.shape))
+
+        dtype_key = '{0}{1:d}'.format(image.dtype.kind, image.dtype.itemsize)
+        if dtype_key not in cls._BINARY_FORMATS:
+            raise TypeError('Image file "{0}" must hold float32 or float64 data. Found "{1}" '
+                            'instead.'.format(filepath, image.dtype))
+        byteorder = image.dtype.byteorder
+        if byteorder in ('=', '|'):
+            endian = sys.byteorder
+        else:
+            endian = 'little' if byteorder == '<' else 'big'
+        # np.memmap objects know where the array data starts within the file
+        spec = 'format="{0}" endian={1} skip={2:d}'.format(cls._BINARY_FORMATS[dtype_key],
+                                                           endian, image.offset)
+        return image, spec
+
+    @staticmethod
+    def _image_stats(image, with_quantiles=False, num_quantiles=1001, bins=4096,
+                     sample_size=1 << 20, chunk_bytes=1 << 24):
+        """
+        Shape, min, max and, if with_quantiles is True, the values at num_quantiles evenly spaced
+        percentiles of an image, ignoring non-finite values. The image is streamed in row chunks,
+        so memory-mapped data is never fully loaded. Without quantiles a single pass is made.
+
+        The first pass takes a strided sample of the values, whose quantiles are the bin edges of
+        the exact cumulative counts taken in the second pass. Bins follow the distribution of the
+        values, so single extreme pixels do not widen them. Counting the values below and up to
+        every edge keeps repeated values of discrete data exact.
+        """
+        rows = max(1, chunk_bytes // max(1, abs(image.strides[0])))
+        stride = max(1, image.size // sample_size)
+        data_min, data_max = np.inf, -np.inf
+        samples = list()
+        for start in range(0, image.shape[0], rows):
+            chunk = np.asarray(image[start:start + rows])
+            chunk = chunk[np.isfinite(chunk)]
+            if chunk.size:
+                data_min = min(data_min, chunk.min())
+                data_max = max(data_max, chunk.max())
+                if with_quantiles:
+                    samples.append(chunk[::stride])
+        if data_min > data_max:
+            raise ValueError('Image does not contain any finite values.')
+        if not with_quantiles:
+            return ImageStats(tuple(image.shape), float(data_min), float(data_max), None)
+        if data_min == data_max:
+            return ImageStats(tuple(image.shape), float(data_min), float(data_max),
+                              np.full(num_quantiles, float(data_min)))
+
+        edges = np.quantile(np.concatenate(samples), np.linspace(0, 1, bins + 1))
+        edges[0], edges[-1] = data_min, data_max
+        edges = np.unique(edges)
+        below = np.zeros(edges.size, dtype=np.int64)
+        up_to = np.zeros(edges.size, dtype=np.int64)
+        for start in range(0, image.shape[0], rows):
+            chunk = np.asarray(image[start:start + rows])
+            chunk = np.sort(chunk[np.isfinite(chunk)], axis=None)
+            below += np.searchsorted(chunk, edges, side='left')
+            up_to += np.searchsorted(chunk, edges, side='right')
+        # Values are assumed to be evenly spread between two edges
+        quantiles = np.interp(np.linspace(0, up_to[-1], num_quantiles),
+                              np.column_stack((below, up_to)).ravel(), np.repeat(edges, 2))
+        return ImageStats(tuple(image.shape), float(data_min), float(data_max), quantiles)
+
+    @classmethod
+    def _cached_image_stats(cls, filepath, load_image, with_quantiles=False):
+        """
+        ImageStats of an image file, cached until its modification time or size changes.
+        load_image is only called on a cache miss.
+        """
+        path = os.path.abspath(filepath)
+        file_stat = os.stat(path)
+        cached = _image_stats_cache.get(path)
+        if (cached is not None and cached[:2] == (file_stat.st_mtime_ns, file_stat.st_size) and
+                (cached[2].quantiles is not None or not with_quantiles)):
+            _image_stats_cache.move_to_end(path)
+            return cached[2]
+        stats = cls._image_stats(load_image(), with_quantiles=with_quantiles)
+        _image_stats_cache[path] = (file_stat.st_mtime_ns, file_stat.st_size, stats)
+        _image_stats_cache.move_to_end(path)
+        while len(_image_stats_cache) > _IMAGE_STATS_CACHE_SIZE:
+            _image_stats_cache.popitem(last=False)
+        return stats
+
+    @staticmethod
+    def _image_percentiles(stats, percentiles):
+        """
+        Values at the given percentiles (0 to 100) interpolated from the image quantiles.
+        """
+        steps = np.linspace(0, 100, stats.quantiles.size)
+        values = list()
+        for percentile in percentiles:
+            if not 0 <= percentile <= 100:
+                raise ValueError('Percentiles must be in the range [0, 100]. Received {0} instead.'
+                                 ''.format(percentile))
+            values.append(float(np.interp(percentile, steps, stats.quantiles)))
+        return values
+
+    @staticmethod
+    def _decimated_rows(x, y, num_buckets, xrange=None):
+        """
+        Indices of the rows with minimum and maximum y in each of num_buckets equally wide x
+        intervals. Peaks stay visible while at most 2 * num_buckets points remain.
+
+        @return numpy.ndarray: Sorted row indices into x and y
+        """
+        valid = np.isfinite(x) & np.isfinite(y)
+        if xrange is not None:
+            valid &= (x >= xrange[0]) & (x <= xrange[1])
+        indices = np.flatnonzero(valid)
+        if indices.size <= 2 * num_buckets:
+            return indices
+        x, y = x[indices], y[indices]
+        xmin, xmax = (x.min(), x.max()) if xrange is None else xrange
+        width = (xmax - xmin) / num_buckets if xmax > xmin else 1
+        buckets = np.minimum(((x - xmin) / width).astype(np.int64), num_buckets - 1)
+        # Sort by bucket and y, so every bucket starts with its min and ends with its max
+        order = np.lexsort((y, buckets))
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+        firsts = order[np.concatenate(([0], bounds))]
+        lasts = order[np.concatenate((bounds - 1, [order.size - 1]))]
+        return indices[np.union1d(firsts, lasts)]
+
+    def _decimate_pending(self):
+        """
+        Decimate the datafile series added by plot_xy since the last rendering. Every file is
+        parsed once for all its series, reading only the columns they use. The parsed table is
+        dropped again as soon as the series are decimated.
+        """
+        pending, self.__pending_decimation = self.__pending_decimation, list()
+        by_file = collections.OrderedDict()
+        for entry in pending:
+            # Series removed from the figure in the meantime are skipped
+            if any(entry[0] is plot for plot in self.__plots):
+                by_file.setdefault(entry[1], list()).append(entry)
+        for path, entries in by_file.items():
+            columns = sorted(set(column for entry in entries for column in entry[2]))
+            table = np.loadtxt(path, usecols=columns, ndmin=2)
+            for series, _, series_columns, num_buckets, xrange in entries:
+                series_table = table[:, [columns.index(column) for column in series_columns]]
+                rows = self._decimated_rows(series_table[:, 0] * series.xscale,
+                                            series_table[:, 1] * series.yscale, num_buckets,
+                                            xrange)
+                series.source = self._binary_source(series_table[rows])
+            del table
+        return
+
+    def _binary_source(self, data):
+        # Columns are streamed to gnuplot as raw float64 records
+        return '"{0}" binary format="{1}"'.format(self._binary_file(data),
+                                                  '%float64' * np.shape(data)[1])
+
+    def _source(self):
+        # Data source of plot commands if no in-memory data is given
+        return '"{0}"'.format(self._datafile)
+
+    @staticmethod
+    def _check_columns(num_columns, *indices):
+        for index in indices:
+            if index is not None and not 0 <= index < num_columns:
+                raise ValueError('Column index {0:d} out of range for data with {1:d} columns.'
+                                 ''.format(index, num_columns))
+        return
+
     def user_cmd(self, cmd_str):
         if not isinstance(cmd_str, str):
             raise TypeError('Figure command must be a string. Received "{0}" instead.'
@@ -259,11 +1379,36 @@ class Figure:
         cmd_str = cmd_str.strip()
 
         # append cmd_str to plot commands
-        if self.__plot_command and not self.__plot_command.strip().endswith(','):
-            self.__plot_command += ', '
-        self.__plot_command += cmd_str
+        if cmd_str:
+            self.__plots.append(cmd_str)
+            for label_index in self._AUTO_LABEL_PATTERN.findall(cmd_str):
+                self.__titles[self._AUTO_LABEL.format(int(label_index))] += 1
         return
 
+    @property
+    def series(self):
+        return tuple(plot for plot in self.__plots if isinstance(plot, XYSeries))
+
+    def remove_series(self, series):
+        """
+        Remove an XYSeries returned by plot_xy from the figure. Once no XY or image plot is
+        left, the next plot_xy builds the configuration again and starts with the first linestyle.
+        """
+        try:
+            self.__plots.remove(series)
+        except ValueError:
+            raise ValueError('Series {0!r} is not part of this figure.'.format(series))
+        self.__titles[series.title] -= 1
+        # Linestyles of the remaining series stay as they are, so the count only restarts at 0
+        if not any(isinstance(plot, (XYSeries, _ImagePlot)) for plot in self.__plots):
+            self.__present_plots = 0
+        return
+
+    def _plot_list(self):
+        if self.__pending_decimation:
+            self._decimate_pending()
+        return ', '.join(plot if isinstance(plot, str) else plot.render() for plot in self.__plots)
+
     def _set_style(self):
         self.__config_command += 'set style line 1 lw 2 pt 7 ps 0.7 lc rgb "#1f17f4";'
         self.__config_command += 'set style line 2 lw 2 pt 5 ps 0.7 lc rgb "#ffa40e";'
@@ -276,7 +1421,56 @@ class Figure:
         return
 
     def plot_xy(self, xdata_ind=0, ydata_ind=1, xerror_ind=None, yerror_ind=None, label=None,
-                xscale=1, yscale=1):
+                xscale=1, yscale=1, data=None, xwindow=None):
+        # xwindow=[xmin, xmax] plots only the rows of Figure.datafile with xmin <= x <= xmax. The
+        # rows are looked up with a DatafileIndex, which needs x in the first column, sorted.
+        window_file = None
+        if xwindow is not None:
+            if data is not None:
+                raise ValueError('Figure.plot_xy xwindow selects rows of Figure.datafile and can '
+                                 'not be used with in-memory data.')
+            if xdata_ind != 0:
+                raise ValueError('Figure.plot_xy xwindow needs the x data in column 0. Received '
+                                 'column {0:d} instead.'.format(xdata_ind))
+        if data is not None:
+            if np is None:
+                raise ImportError('Plotting in-memory arrays requires numpy.')
+            shape = np.shape(data)
+            if len(shape) != 2:
+                raise ValueError('Figure.plot_xy data must be a 2D array with one column per '
+                                 'quantity. Received shape {0} instead.'.format(shape))
+            self._check_columns(shape[1], xdata_ind, ydata_ind, xerror_ind, yerror_ind)
+        elif self._datafile is not None and os.path.isfile(self.datafile):
+            self._check_columns(datafile_info(self.datafile).num_columns, xdata_ind, ydata_ind,
+                                xerror_ind, yerror_ind)
+        if xwindow is not None:
+            window_file = self._window_file(xwindow)
+
+        if self.decimate is not None:
+            columns = [xdata_ind, ydata_ind]
+            columns += [index for index in (xerror_ind, yerror_ind) if index is not None]
+            if data is None:
+                if np is None:
+                    raise ImportError('Figure.decimate requires numpy.')
+            else:
+                table = np.asarray(data)[:, columns]
+                rows = self._decimated_rows(table[:, 0] * xscale, table[:, 1] * yscale,
+                                            self.decimate, self.xrange)
+                data = table[rows]
+            xdata_ind, ydata_ind = 0, 1
+            xerror_ind = None if xerror_ind is None else 2
+            yerror_ind = None if yerror_ind is None else len(columns) - 1
+
+        if data is not None:
+            source = self._binary_source(data)
+        elif self.decimate is not None:
+            # Decimated together with the other series of the file when the figure is rendered
+            source = None
+        elif window_file is not None:
+            source = '"{0}"'.format(window_file)
+        else:
+            source = self._source()
+
         # Create configuration command string if this is the first xy plot
         if self.__present_plots == 0:
             # Clear old config command
@@ -304,46 +1498,78 @@ class Figure:
             linestyle = 2 * self.__present_plots + 1 if self.__present_plots > 1 else self.__present_plots * 3 + 1
         else:
             linestyle = 2 * self.__present_plots + 1
-        err_linestyle = linestyle + 1
 
         if label is None:
-            label_index = 1
-            while ' title "Data {0:d}"'.format(label_index) in self.__plot_command:
-                label_index += 1
-            label = 'Data {0:d}'.format(label_index)
-
-        plt_cmd = ''
-        if xerror_ind is not None and yerror_ind is not None:
-            plt_cmd += self._PLOT_XY_XYERR.format(FILE=self._datafile, TITLE=label, X=xdata_ind+1,
-                                                  Y=ydata_ind+1, XE=xerror_ind+1, YE=yerror_ind+1,
-                                                  LS=err_linestyle, XSCALE=xscale, YSCALE=yscale)
-        elif xerror_ind is not None:
-            plt_cmd += self._PLOT_XY_XERR.format(FILE=self._datafile, TITLE=label, X=xdata_ind+1,
-                                                 Y=ydata_ind+1, XE=xerror_ind+1, LS=err_linestyle,
-                                                 XSCALE=xscale, YSCALE=yscale)
-        elif yerror_ind is not None:
-            plt_cmd += self._PLOT_XY_YERR.format(FILE=self._datafile, TITLE=label, X=xdata_ind+1,
-                                                 Y=ydata_ind+1, YE=yerror_ind+1, LS=err_linestyle,
-                                                 XSCALE=xscale, YSCALE=yscale)
-        else:
-            plt_cmd += self._PLOT_XY_LP_DASHED.format(FILE=self._datafile, TITLE=label, X=xdata_ind+1,
-                                               Y=ydata_ind+1, LS=linestyle, XSCALE=xscale,
-                                               YSCALE=yscale)
-
-        if xerror_ind is not None or yerror_ind is not None:
-            plt_cmd += ', '
-            plt_cmd += self._PLOT_XY_LP_DASHED.format(FILE=self._datafile, TITLE=label,
-                                                      X=xdata_ind+1, Y=ydata_ind+1, LS=linestyle,
-                                                      XSCALE=xscale, YSCALE=yscale)
-
-        if self.__plot_command and not self.__plot_command.strip().endswith(','):
-            self.__plot_command = self.__plot_command.strip(';')
-            self.__plot_command += ', '
-        self.__plot_command += plt_cmd
+            while self.__titles[self._AUTO_LABEL.format(self.__label_counter)] > 0:
+                self.__label_counter += 1
+            label = self._AUTO_LABEL.format(self.__label_counter)
+
+        series = XYSeries(source, xdata_ind, ydata_ind, xerror=xerror_ind, yerror=yerror_ind,
+                          xscale=xscale, yscale=yscale, linestyle=linestyle, title=label)
+        if source is None:
+            self.__pending_decimation.append(
+                (series, self.datafile if window_file is None else window_file, columns,
+                 self.decimate, None if self.xrange is None else tuple(self.xrange)))
+        self.__plots.append(series)
+        self.__titles[label] += 1
         self.__present_plots += 1
-        return
+        return series
+
+    def plot_img(self, percentile_range=None, colorbar_range=None, colorbar_label=None,
+                 data=None, shape=None, dtype=None, mipmap=None, crop=None):
+        """
+        Plot a matrix as image. By default the ASCII matrix in Figure.datafile is plotted.
+
+        data can be a 2D array or the path to a float32/float64 .npy file or raw binary file. Raw
+        files need shape (rows, columns) and optionally dtype (default float64). Binary files are
+        memory-mapped and read by gnuplot in place without conversion.
+
+        percentile_range clips the colorbar to the given lower and upper percentiles (0 to 100)
+        of the image values. Image statistics are computed in Python and cached per file, so
+        gnuplot does not need a stats pass over the data. Without numpy gnuplot's stats
+        command is used instead and percentile_range is not available.
+
+        mipmap ('mean' or 'max') plots the coarsest level of an ImagePyramid that still fills the
+        terminal width. Pyramids of files are stored next to them and reused.
+        crop [[xmin, xmax], [ymin, ymax]] zooms into the image without changing its axis scaling,
+        which Figure.xrange and Figure.yrange define. Only the cropped rows of binary images and
+        pyramid levels are read.
+        """
+        image_path, binary_spec = None, None
+        if crop is not None and (len(crop) != 2 or len(crop[0]) != 2 or len(crop[1]) != 2):
+            raise TypeError('Figure.plot_img crop must be of the form [[xmin, xmax], [ymin, ymax]].'
+                            ' Received "{0}" instead.'.format(crop))
+        # Quantiles are only computed for percentile_range, min and max only for the default
+        # colorbar range
+        with_quantiles = percentile_range is not None and len(percentile_range) == 2
+        with_range = with_quantiles or colorbar_range is None or len(colorbar_range) != 2
+        if data is None:
+            if np is None:
+                stats = None
+            else:
+                stats = self._cached_image_stats(
+                    self.datafile, lambda: np.loadtxt(self.datafile, ndmin=2), with_quantiles)
+        else:
+            if np is None:
+                raise ImportError('Plotting in-memory arrays requires numpy.')
+            if isinstance(data, str):
+                image, binary_spec = self._map_image_file(data, shape=shape, dtype=dtype)
+                image_path = os.path.abspath(data).replace('\\', '/')
+                self.__source_files.append(image_path)
+                if with_range:
+                    stats = self._cached_image_stats(data, lambda: image, with_quantiles)
+                else:
+                    stats = ImageStats(tuple(image.shape), None, None, None)
+            else:
+                image, binary_spec = np.asanyarray(data), 'format="%float64"'
+                if image.ndim != 2:
+                    raise ValueError('Figure.plot_img data must be a 2D array. Received shape {0} '
+                                     'instead.'.format(image.shape))
+                if with_range:
+                    stats = self._image_stats(image, with_quantiles)
+                else:
+                    stats = ImageStats(tuple(image.shape), None, None, None)
 
-    def plot_img(self, percentile_range=None, colorbar_range=None, colorbar_label=None):
         # Clear old config command
         self.__config_command = ''
 
@@ -358,38 +1584,144 @@ class Figure:
             self.__config_command += self._SET_XLABEL.format(LABEL=self.xlabel)
         if self.ylabel is not None:
             self.__config_command += self._SET_YLABEL.format(LABEL=self.ylabel)
-        self.__config_command += 'stat "{0}" matrix u 3 nooutput;'.format(self._datafile)
+        if stats is None:
+            self.__config_command += 'stat "{0}" matrix u 3 nooutput;'.format(self._datafile)
         if percentile_range is not None and len(percentile_range) == 2:
-            self.__config_command += 'set cbrange [{0}*STATS_min:{1}*STATS_max];'.format(
-                percentile_range[0], percentile_range[1])
+            if stats is None:
+                raise ImportError('Figure.plot_img percentile_range requires numpy.')
+            self.__config_command += 'set cbrange [{0}:{1}];'.format(
+                *self._image_percentiles(stats, percentile_range))
         elif colorbar_range is not None and len(colorbar_range) == 2:
             self.__config_command += 'set cbrange [{0}:{1}];'.format(
                 colorbar_range[0], colorbar_range[1])
-        else:
+        elif stats is None:
             self.__config_command += 'set cbrange [STATS_min:STATS_max];'
+        else:
+            self.__config_command += 'set cbrange [{0}:{1}];'.format(stats.min, stats.max)
         self.__config_command += 'set format cb "%.0s%c";'
         if self.xrange is not None:
             self.__config_command += self._SET_XRANGE.format(MIN=self.xrange[0], MAX=self.xrange[1])
         if self.yrange is not None:
             self.__config_command += self._SET_YRANGE.format(MIN=self.yrange[0], MAX=self.yrange[1])
+        if crop is not None:
+            self.__config_command += self._SET_XRANGE.format(MIN=min(crop[0]), MAX=max(crop[0]))
+            self.__config_command += self._SET_YRANGE.format(MIN=min(crop[1]), MAX=max(crop[1]))
         self.__config_command += 'set xtics nomirror out;'
         self.__config_command += 'set ytics nomirror out;'
         self.__config_command += 'set size ratio -1;'
         if colorbar_label is not None:
             self.__config_command += 'set cblabel "{0}" offset 1,0;'.format('counts/s')
 
-        plt_cmd = self._PLOT_IMG.format(FILE=self._datafile,
-                                        XMIN=self.xrange[0], XMAX=self.xrange[1],
-                                        YMIN=self.yrange[0], YMAX=self.yrange[1])
+        level = 0
+        if mipmap is not None:
+            if np is None:
+                raise ImportError('Figure.plot_img mipmap requires numpy.')
+            if data is None:
+                pyramid = ImagePyramid.from_file(
+                    self.datafile, lambda: np.loadtxt(self.datafile, ndmin=2), mipmap)
+            elif image_path is not None:
+                pyramid = ImagePyramid.from_file(image_path, lambda: image, mipmap)
+            else:
+                pyramid = ImagePyramid.from_array(image, mipmap)
+            row_start, row_stop, column_start, column_stop = self._crop_pixels(crop, stats.shape)
+            level = pyramid.level_for(self._DEFAULT_TERMINAL_WIDTH, row_stop - row_start,
+                                      column_stop - column_start)
+
+        if level > 0:
+            level_image, level_path = pyramid.level(level)
+            if level_path is not None:
+                self.__source_files.append(level_path)
+                level_spec = self._map_image_file(level_path)[1]
+            else:
+                level_spec = None
+            plt_cmd = self._image_tile_command(level_image, level_path, level_spec, stats.shape,
+                                               crop, scale=2 ** level)
+        elif data is not None and crop is not None:
+            plt_cmd = self._image_tile_command(image, image_path, binary_spec, stats.shape, crop)
+        elif data is None:
+            if stats is None:
+                num_x, num_y = 'STATS_size_x', 'STATS_size_y'
+            else:
+                num_y, num_x = stats.shape
+            plt_cmd = self._PLOT_IMG.format(FILE=self._datafile, NX=num_x, NY=num_y,
+                                            XMIN=self.xrange[0], XMAX=self.xrange[1],
+                                            YMIN=self.yrange[0], YMAX=self.yrange[1])
+        else:
+            if image_path is None:
+                image_path = self._binary_file(image)
+            plt_cmd = self._binary_image_command(image_path, stats.shape, binary_spec)
 
-        if self.__plot_command and not self.__plot_command.strip().endswith(','):
-            self.__plot_command = self.__plot_command.strip(';')
-            self.__plot_command += ', '
-        self.__plot_command += plt_cmd
+        self.__plots.append(_ImagePlot(plt_cmd))
         self.__present_plots += 1
         return
 
+    def _binary_image_command(self, path, shape, binary_spec='format="%float64"', scale=1,
+                              offset=(0, 0), full_shape=None):
+        """
+        Plot command of a binary image. Rows of a C-ordered array are y, columns are x and the
+        pixel centers of the full_shape image span the axis ranges. A reduced level with scale
+        full resolution pixels per pixel, or a tile starting at offset (row, column) of the
+        reduced image, is placed where it belongs within the full image.
+        """
+        num_y, num_x = shape
+        full_y, full_x = shape if full_shape is None else full_shape
+        xmin, xmax = self.xrange if self.xrange is not None else (0, full_x - 1)
+        ymin, ymax = self.yrange if self.yrange is not None else (0, full_y - 1)
+        dx = (xmax - xmin) / (full_x - 1) if full_x > 1 else 1
+        dy = (ymax - ymin) / (full_y - 1) if full_y > 1 else 1
+        if scale != 1 or offset != (0, 0):
+            xmin += dx * (offset[1] * scale + (scale - 1) / 2)
+            ymin += dy * (offset[0] * scale + (scale - 1) / 2)
+            dx, dy = dx * scale, dy * scale
+        return self._PLOT_IMG_BINARY.format(FILE=path, NX=num_x, NY=num_y, SPEC=binary_spec,
+                                            DX=dx, DY=dy, XMIN=xmin, YMIN=ymin)
+
+    def _crop_pixels(self, crop, shape):
+        """
+        @return tuple: (row start, row stop, column start, column stop) of the full resolution
+                       pixels within crop
+        """
+        num_y, num_x = shape
+        if crop is None:
+            return 0, num_y, 0, num_x
+        bounds = list()
+        for (low, high), axis_range, num in ((crop[1], self.yrange, num_y),
+                                             (crop[0], self.xrange, num_x)):
+            axis_min, axis_max = axis_range if axis_range is not None else (0, num - 1)
+            step = (axis_max - axis_min) / (num - 1) if num > 1 else 1
+            bounds.append(max(0, int(np.floor((min(low, high) - axis_min) / step))))
+            bounds.append(min(num, int(np.ceil((max(low, high) - axis_min) / step)) + 1))
+        if bounds[0] >= bounds[1] or bounds[2] >= bounds[3]:
+            raise ValueError('Figure.plot_img crop {0} does not overlap the image.'.format(crop))
+        return tuple(bounds)
+
+    def _image_tile_command(self, image, path, binary_spec, full_shape, crop, scale=1):
+        """
+        Plot command of the part of image within crop. image is the full resolution image or a
+        pyramid level reduced by scale. It is read in place from path if no cropping is needed.
+        """
+        row_start, row_stop, column_start, column_stop = self._crop_pixels(crop, full_shape)
+        row_start, column_start = row_start // scale, column_start // scale
+        row_stop = min(image.shape[0], -(-row_stop // scale))
+        column_stop = min(image.shape[1], -(-column_stop // scale))
+        if path is not None and (row_start, row_stop, column_start, column_stop) == (
+                0, image.shape[0], 0, image.shape[1]):
+            return self._binary_image_command(path, image.shape, binary_spec, scale=scale,
+                                              full_shape=full_shape)
+        tile = image[row_start:row_stop, column_start:column_stop]
+        return self._binary_image_command(self._binary_file(tile), tile.shape, scale=scale,
+                                          offset=(row_start, column_start), full_shape=full_shape)
+
     def show(self):
+        build_start = time.perf_counter() if _run_hooks else None
+        command = self._show_command()
+
+        # Run gnuplot with command.
+        # The process will be persistent, so it will run until the user closes the plot window
+        self._run(cmd=command, persistent=True, build_start=build_start)
+        return command
+
+    def _show_command(self):
         # set proper terminal and global font style
         if self.font and self.font_size:
             command = 'set terminal {0} font "{1},{2:d}";'.format(default_terminal,
@@ -398,78 +1730,568 @@ class Figure:
             command = 'set terminal {0};'.format(default_terminal)
         if self._datadir:
             command += 'cd "{0}";'.format(self._datadir)
-        # Append command strings config first, then user commands and then plot commands
-        command += '{0};{1};plot {2};'.format(self.__config_command,
-                                              self.__user_command, self.__plot_command)
-
-        # Run gnuplot with command.
-        # The process will be persistent, so it will run until the user closes the plot window
-        self.run(cmd=command, persistent=True)
+        command += self._plot_body()
         return command
 
-    def save_figure(self, filename='myfigure', filetype=None):
+    @staticmethod
+    def _output_target(filename, filetype=None):
         split_name = filename.rsplit('.', 1)
         if len(split_name) != 2:
             filetype = 'png' if filetype is None else filetype
         else:
             filename = split_name[0]
             filetype = split_name[1].lower() if filetype is None else filetype.lower()
-
+        return '{0}.{1}'.format(filename, filetype), filetype
+
+    @classmethod
+    def _output_targets(cls, filenames):
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        targets = [cls._output_target(filename) for filename in filenames]
+        if not targets:
+            raise ValueError('Figure.save_figures needs at least one filename.')
+        return targets
+
+    def _terminal_command(self, filetype):
         if self.font and self.font_size:
             font_spec = ' font "{0},{1:d}"'.format(self.font, self.font_size)
         else:
             font_spec = ''
         # Set terminal according to filetype
         if filetype == 'pdf':
-            command = 'set terminal pdfcairo{0};'.format(font_spec)
+            return 'set terminal pdfcairo{0};'.format(font_spec)
         elif filetype == 'png':
-            command = 'set terminal pngcairo{0};'.format(font_spec)
+            return 'set terminal pngcairo{0};'.format(font_spec)
         elif filetype == 'svg':
-            command = 'set terminal svg enhanced{0};'.format(font_spec)
-        else:
-            raise NameError('Invalid filetype specifier "{0}". Allowed filetypes are: pdf, png and '
-                            'svg.'.format(filetype))
+            return 'set terminal svg enhanced{0};'.format(font_spec)
+        raise NameError('Invalid filetype specifier "{0}". Allowed filetypes are: pdf, png and '
+                        'svg.'.format(filetype))
 
-        # Set terminal output to file to create
-        filename += '.{0}'.format(filetype)
-        if self._datadir:
-            command += 'cd "{0}";'.format(self._datadir)
-        command += 'set output "{0}";'.format(filename)
+    def _save_command(self, targets):
+        """
+        Build the command string writing the figure to every (filename, filetype) in targets.
+
+        The configuration, user commands and the first plot are issued only once. Every
+        additional target just switches terminal and output and replots, which makes gnuplot read
+        and parse the plotted data again.
+        """
+        command = ''
+        for index, (filename, filetype) in enumerate(targets):
+            command += self._terminal_command(filetype)
+            if index > 0:
+                command += 'set output "{0}";replot;'.format(filename)
+                continue
+            # Set terminal output to file to create
+            if self._datadir:
+                command += 'cd "{0}";'.format(self._datadir)
+            command += 'set output "{0}";'.format(filename)
+            command += self._plot_body()
+        # Close the output file so it is complete even if gnuplot keeps running (session mode)
+        command += 'unset output;'
+        return command
+
+    def _plot_body(self, plot_list=None):
         # Append command strings config first, then user commands and then plot commands
+        if plot_list is None:
+            plot_list = self._plot_list()
         if self.__user_command:
-            command += '{0};{1};plot {2};'.format(self.__config_command,
-                                                  self.__user_command, self.__plot_command)
+            return '{0};{1};plot {2};'.format(self.__config_command, self.__user_command,
+                                              plot_list)
+        return '{0};plot {1};'.format(self.__config_command, plot_list)
+
+    def _user_commands(self):
+        return self.__user_command
+
+    def _data_files(self):
+        """
+        @return tuple: (paths of datafiles read by the plot commands, paths of temporary files)
+        """
+        files = list(self.__source_files) + self._user_files()
+        if self._datafile is not None:
+            files.append(self.datafile)
+        return files, list(self.__tempfiles)
+
+    def _user_files(self):
+        """
+        Existing files named by quoted strings in user commands and user plot commands, resolved
+        against the directory gnuplot changes into. Files named in any other way are not found.
+        """
+        directory = self._datadir if self._datadir else os.getcwd()
+        texts = [self.__user_command]
+        texts += [plot for plot in self.__plots
+                  if isinstance(plot, str) and not isinstance(plot, _ImagePlot)]
+        files = list()
+        for text in texts:
+            for double_quoted, single_quoted in self._QUOTED_PATTERN.findall(text):
+                path = os.path.join(directory, double_quoted or single_quoted)
+                if os.path.isfile(path):
+                    files.append(os.path.abspath(path))
+        return files
+
+    def _output_path(self, filename):
+        # gnuplot resolves output files relative to the datafile directory (see _save_command)
+        return os.path.join(self._datadir if self._datadir else os.getcwd(), filename)
+
+    def _cache_key(self, filetype):
+        command = self._terminal_command(filetype) + self._plot_body()
+        files, tempfiles = self._data_files()
+        # Temporary array files get random names, so identify them by content instead
+        for path in tempfiles:
+            digest = _tempfile_digests.get(path)
+            if digest is None:
+                digest = hashlib.sha256()
+                with open(path, 'rb') as file:
+                    for chunk in iter(lambda: file.read(1 << 20), b''):
+                        digest.update(chunk)
+                digest = _tempfile_digests[path] = digest.hexdigest()
+            command = command.replace(path, digest)
+        return RenderCache.key('{0}\0{1}'.format(self._datadir, command), files)
+
+    def _uncached_targets(self, targets):
+        """
+        Serve targets from the render cache if possible and return the ones left to render.
+        """
+        if self.render_cache is None:
+            return targets
+        return [(filename, filetype) for filename, filetype in targets
+                if not self.render_cache.fetch(self._cache_key(filetype), filetype,
+                                               self._output_path(filename))]
+
+    def _cache_targets(self, targets):
+        if self.render_cache is not None:
+            for filename, filetype in targets:
+                self.render_cache.store(self._cache_key(filetype), filetype,
+                                        self._output_path(filename))
+        return
+
+    def save_figure(self, filename='myfigure', filetype=None):
+        return self.save_figures([self._output_target(filename, filetype)[0]])
+
+    def render_bytes(self, filetype='png'):
+        """
+        Render the figure and return the file content without writing it to disk.
+
+        @param str filetype: Any filetype supported by save_figure
+        @return bytes: Content of the rendered file
+        """
+        if self.render_client is not None:
+            return self.render_client.render(self, filetype)
+        return b''.join(self.iter_render_bytes(filetype))
+
+    def iter_render_bytes(self, filetype='png', chunk_size=65536):
+        """
+        Render the figure and yield the file content in chunks as gnuplot writes them to stdout.
+
+        gnuplot always runs as a separate process here, since the stdout of a GnuplotSession can
+        not be told apart between commands. Closing the generator early kills gnuplot.
+
+        @param str filetype: Any filetype supported by save_figure
+        @param int chunk_size: Maximum size of the yielded chunks in bytes
+        """
+        if self.render_client is not None:
+            output = self.render_client.render(self, filetype)
+            for offset in range(0, len(output), chunk_size):
+                yield output[offset:offset + chunk_size]
+            return
+        build_start = time.perf_counter() if _run_hooks else None
+        command = self._terminal_command(filetype.lower())
+        if self._datadir:
+            command += 'cd "{0}";'.format(self._datadir)
+        # Without a filename the output goes to stdout
+        command += 'set output;' + self._plot_body() + 'unset output;'
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('Running gnuplot command (%d characters): %.200s', len(command), command)
+
+        args = ['gnuplot', '-e', command]
+        start = time.perf_counter()
+        proc = subprocess.Popen(args, shell=False, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        spawn_time = time.perf_counter() - start
+        stderr_chunks = list()
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()))
+        stderr_reader.start()
+        timed_out = list()
+        watchdog = None
+        if self.timeout is not None:
+            watchdog = threading.Timer(self.timeout, lambda: timed_out.append(True) or proc.kill())
+            watchdog.start()
+        first_byte_time, size, error = None, 0, None
+        try:
+            for chunk in iter(lambda: proc.stdout.read1(chunk_size), b''):
+                if first_byte_time is None:
+                    first_byte_time = time.perf_counter() - start
+                size += len(chunk)
+                yield chunk
+            proc.wait()
+            stderr_reader.join()
+            stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+            if timed_out:
+                error = subprocess.TimeoutExpired(args, self.timeout, stderr=stderr)
+            elif proc.returncode != 0:
+                error = ChildProcessError(stderr)
+            if _run_hooks:
+                build_time = None if build_start is None else start - build_start
+                _emit_run_event(RunEvent(len(command), build_time, spawn_time, first_byte_time,
+                                         time.perf_counter() - start, proc.returncode,
+                                         len(stderr), size, False, error))
+            if error is not None:
+                raise error
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            stderr_reader.join()
+            proc.stdout.close()
+            proc.stderr.close()
+        return
+
+    def save_animation(self, filename, frames, delay=10, shape=None, dtype=None):
+        """
+        Render a sequence of frames in a single gnuplot process.
+
+        Configure the figure as usual with plot_xy and/or plot_img. For every frame the plotted
+        data is replaced by the frame data while terminal, style and configuration are sent only
+        once. frames can be an iterable of datafile paths (ASCII, .npy or raw binary with shape and
+        dtype) or of arrays, or an int N to animate the first N indexed data blocks of
+        Figure.datafile (XY plots only). Frames are sent one at a time, so any iterable works.
+
+        A filename ending in .gif produces an animated gif with delay in 1/100 s between frames.
+        Otherwise one file is written per frame. filename may be a pattern like "f_{0:04d}.png",
+        else the frame number is appended to the name, e.g. "scan.png" gives "scan_0000.png".
+
+        @return int: Number of frames rendered
+        """
+        name, filetype = self._output_target(filename)
+        if filetype == 'gif':
+            if self.font and self.font_size:
+                font_spec = ' font "{0},{1:d}"'.format(self.font, self.font_size)
+            else:
+                font_spec = ''
+            command = 'set terminal gif animate delay {0:d}{1};'.format(int(delay), font_spec)
+            pattern = None
         else:
-            command += '{0};plot {1};'.format(self.__config_command, self.__plot_command)
+            command = self._terminal_command(filetype)
+            if '{' in name:
+                pattern = name
+            else:
+                pattern = '{0}_{{0:04d}}.{1}'.format(name.rsplit('.', 1)[0], filetype)
+        if self._datadir:
+            command += 'cd "{0}";'.format(self._datadir)
+        if pattern is None:
+            command += 'set output "{0}";'.format(name)
+        command += '{0};{1};'.format(self.__config_command, self.__user_command)
+
+        if isinstance(frames, int):
+            if any(isinstance(plot, _ImagePlot) for plot in self.__plots):
+                raise ValueError('Indexed data blocks can only be animated for XY plots. Pass the '
+                                 'image frames as files or arrays instead.')
+            # gnuplot loops over the blocks itself, so this is a single command
+            source = '"{0}" index PYGNUPLOT_FRAME'.format(self._datafile)
+            command += 'do for [PYGNUPLOT_FRAME=0:{0:d}] {{'.format(frames - 1)
+            if pattern is not None:
+                command += 'set output sprintf("{0}", PYGNUPLOT_FRAME);'.format(
+                    re.sub(r'\{0?:?0?(\d*)d?\}', r'%0\1d', pattern))
+            command += 'plot {0};}};unset output;'.format(self._frame_plot_list(source))
+            self.run(cmd=command, persistent=False)
+            return frames
+
+        has_image = any(isinstance(plot, _ImagePlot) for plot in self.__plots)
+        session = self.session if self.session is not None else GnuplotSession(persist=False)
+        try:
+            session.run(command, timeout=self.timeout)
+            restarts = session.restarts
+            num_frames = 0
+            for index, frame in enumerate(frames):
+                frame_command = ''
+                if pattern is not None:
+                    frame_command += 'set output "{0}";'.format(pattern.format(index))
+                temp_path = None
+                if isinstance(frame, str):
+                    plot_list = self._frame_plot_list('"{0}"'.format(
+                        os.path.abspath(frame).replace('\\', '/')),
+                        self._frame_image_command(frame, shape, dtype))
+                else:
+                    array = np.asarray(frame)
+                    temp_path = self._write_binary(array)
+                    source = '"{0}" binary format="{1}"'.format(
+                        temp_path, '%float64' * (array.shape[1] if array.ndim == 2 else 1))
+                    if has_image and array.ndim != 2:
+                        raise ValueError('Image frames must be 2D arrays. Received shape {0} at '
+                                         'frame {1:d}.'.format(array.shape, index))
+                    plot_list = self._frame_plot_list(
+                        source,
+                        self._binary_image_command(temp_path, array.shape) if has_image else None)
+                try:
+                    session.run(frame_command + 'plot {0};'.format(plot_list),
+                                timeout=self.timeout, reset=False)
+                finally:
+                    if temp_path is not None:
+                        self._remove_files([temp_path])
+                if session.restarts != restarts:
+                    raise ChildProcessError('gnuplot restarted during the animation at frame '
+                                            '{0:d}.'.format(index))
+                num_frames += 1
+            session.run('unset output;', timeout=self.timeout, reset=False)
+        finally:
+            if session is not self.session:
+                session.close()
+        return num_frames
+
+    def _frame_plot_list(self, source, image_command=None):
+        # Plot elements with the data of XY series and images replaced by a single frame
+        plots = list()
+        for plot in self.__plots:
+            if isinstance(plot, XYSeries):
+                plots.append(XYSeries(source, plot.x, plot.y, plot.xerror, plot.yerror, plot.xscale,
+                                      plot.yscale, plot.linestyle, plot.title).render())
+            elif isinstance(plot, _ImagePlot) and image_command is not None:
+                plots.append(image_command)
+            else:
+                plots.append(plot)
+        return ', '.join(plots)
+
+    def _frame_image_command(self, filepath, shape=None, dtype=None):
+        if not any(isinstance(plot, _ImagePlot) for plot in self.__plots):
+            return None
+        path = os.path.abspath(filepath).replace('\\', '/')
+        if filepath.lower().endswith('.npy') or shape is not None:
+            image, binary_spec = self._map_image_file(filepath, shape=shape, dtype=dtype)
+            return self._binary_image_command(path, image.shape, binary_spec)
+        # Only the shape of the ASCII matrix is needed. Rows are counted without parsing them and
+        # nothing is cached, so memory does not grow with the number of frames.
+        num_x, num_y = 0, 0
+        with open(filepath, 'rb') as file:
+            for line in file:
+                line = line.strip()
+                if line and not line.startswith(b'#'):
+                    if num_y == 0:
+                        num_x = len(line.split())
+                    num_y += 1
+        return self._PLOT_IMG.format(FILE=path, NX=num_x, NY=num_y,
+                                     XMIN=self.xrange[0], XMAX=self.xrange[1],
+                                     YMIN=self.yrange[0], YMAX=self.yrange[1])
+
+    def save_figures(self, filenames):
+        """
+        Save the figure to several files in a single gnuplot run, e.g. ['out.png', 'out.pdf'].
+        gnuplot starts once and configuration, user commands and image statistics are evaluated
+        only once for all files. The plotted data is still parsed again for every file.
+
+        @param list filenames: Output filenames. The extension selects the filetype (default png).
+        @return str: The command string run with gnuplot
+        """
+        build_start = time.perf_counter() if _run_hooks else None
+        targets = self._output_targets(filenames)
+        pending = self._uncached_targets(targets)
+        command = self._save_command(pending if pending else targets)
+        if not pending:
+            return command
+        if self.render_client is not None:
+            self._save_client_targets(pending)
+            self._cache_targets(pending)
+            return command
 
         # Run gnuplot with command
-        self.run(cmd=command, persistent=False)
+        self._run(cmd=command, persistent=False, build_start=build_start,
+                  outputs=[self._output_path(filename) for filename, _ in pending])
+        self._cache_targets(pending)
         return command
 
+    def _save_client_targets(self, targets):
+        # Render targets on the server of Figure.render_client and write the returned files
+        for filename, filetype in targets:
+            output = self.render_client.render(self, filetype)
+            with open(self._output_path(filename), 'wb') as file:
+                file.write(output)
+        return
+
     def run(self, cmd, persistent=False):
         """
-        Start a gnuplot subprocess and run cmd.
+        Start a gnuplot subprocess and run cmd. If a GnuplotSession is attached to this Figure the
+        command is sent to the running session instead.
 
         @param str cmd: The command to be run with gnuplot
-        @param bool persistent: If the process should be persistent or not.
-        @return int: Subprocess return code
+        @param bool persistent: If the process should be persistent or not. Ignored in session mode.
+        @return subprocess.CompletedProcess: Result of the gnuplot run
         """
-        args = ['gnuplot', '-p', '-e', cmd] if persistent else ['gnuplot', '-e', cmd]
-        print(cmd)
-        # Run process and pass command string through stdin pipe
-        proc_res = subprocess.run(args, shell=False, encoding='utf-8', universal_newlines=True,
-                                  timeout=self.timeout, stdin=subprocess.PIPE,
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        # Catch error from stderr and raise it
-        if proc_res.returncode != 0:
-            raise ChildProcessError(proc_res.stderr)
+        return self._run(cmd, persistent=persistent)
+
+    def _run(self, cmd, persistent=False, build_start=None, outputs=(), session=None):
+        """
+        Run cmd and report a RunEvent to the registered run hooks.
+
+        @param float build_start: time.perf_counter() value when building cmd started
+        @param iterable outputs: Paths of the files written by cmd, to report their size
+        @param GnuplotSession session: Session to use instead of Figure.session
+        """
+        session = self.session if session is None else session
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('Running gnuplot command (%d characters): %.200s', len(cmd), cmd)
+        if not _run_hooks:
+            if session is not None:
+                return session.run(cmd, timeout=self.timeout)
+            args = ['gnuplot', '-p', '-e', cmd] if persistent else ['gnuplot', '-e', cmd]
+            # Run process and pass command string through stdin pipe
+            proc_res = subprocess.run(args, shell=False, encoding='utf-8', universal_newlines=True,
+                                      timeout=self.timeout, stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # Catch error from stderr and raise it
+            if proc_res.returncode != 0:
+                raise ChildProcessError(proc_res.stderr)
+            return proc_res
+
+        start = time.perf_counter()
+        build_time = None if build_start is None else start - build_start
+        spawn_time, first_byte_time, returncode, stderr_size = None, None, None, 0
+        try:
+            if session is not None:
+                proc_res = session.run(cmd, timeout=self.timeout)
+            else:
+                args = ['gnuplot', '-p', '-e', cmd] if persistent else ['gnuplot', '-e', cmd]
+                proc_res, spawn_time, first_byte_time = self._run_timed(args, start)
+            returncode, stderr_size = proc_res.returncode, len(proc_res.stderr)
+            if returncode != 0:
+                raise ChildProcessError(proc_res.stderr)
+        except (ChildProcessError, subprocess.TimeoutExpired) as err:
+            stderr_size = len(err.stderr or '') if hasattr(err, 'stderr') else len(str(err))
+            _emit_run_event(RunEvent(len(cmd), build_time, spawn_time, first_byte_time,
+                                     time.perf_counter() - start, returncode, stderr_size,
+                                     _output_size(outputs), session is not None, err))
+            raise
+        _emit_run_event(RunEvent(len(cmd), build_time, spawn_time, first_byte_time,
+                                 time.perf_counter() - start, returncode, stderr_size,
+                                 _output_size(outputs), session is not None, None))
         return proc_res
 
+    def _run_timed(self, args, start):
+        """
+        subprocess.run equivalent that also measures process spawn and time to first output byte.
+
+        @return tuple: (subprocess.CompletedProcess, spawn time, time to first byte)
+        """
+        proc = subprocess.Popen(args, shell=False, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        spawn_time = time.perf_counter() - start
+        first_byte = list()
+        streams = {'stdout': [], 'stderr': []}
+
+        def read(stream, chunks):
+            for chunk in iter(lambda: stream.read1(65536), b''):
+                if not first_byte:
+                    first_byte.append(time.perf_counter() - start)
+                chunks.append(chunk)
+
+        readers = [threading.Thread(target=read, args=(proc.stdout, streams['stdout'])),
+                   threading.Thread(target=read, args=(proc.stderr, streams['stderr']))]
+        for reader in readers:
+            reader.start()
+        try:
+            proc.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            for reader in readers:
+                reader.join()
+            proc.stdout.close()
+            proc.stderr.close()
+        stdout = b''.join(streams['stdout']).decode('utf-8', errors='replace')
+        stderr = b''.join(streams['stderr']).decode('utf-8', errors='replace')
+        proc_res = subprocess.CompletedProcess(args, proc.returncode, stdout=stdout, stderr=stderr)
+        return proc_res, spawn_time, first_byte[0] if first_byte else None
+
+    async def run_async(self, cmd, persistent=False):
+        """
+        Coroutine version of Figure.run based on asyncio subprocesses.
+
+        At most max_async_renders gnuplot processes run concurrently per event loop. If the
+        coroutine is cancelled or times out the gnuplot process is killed.
+
+        @param str cmd: The command to be run with gnuplot
+        @param bool persistent: If the process should be persistent or not. Ignored in session mode.
+        @return subprocess.CompletedProcess: Result of the gnuplot run
+        """
+        return await self._run_async(cmd, persistent=persistent)
+
+    async def _run_async(self, cmd, persistent=False, build_start=None, outputs=()):
+        if self.session is not None:
+            # The session serializes commands anyway, so just keep the event loop free
+            return await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self._run(cmd, build_start=build_start, outputs=outputs))
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('Running gnuplot command (%d characters): %.200s', len(cmd), cmd)
+        args = ['gnuplot', '-p', '-e', cmd] if persistent else ['gnuplot', '-e', cmd]
+        start = time.perf_counter() if _run_hooks else None
+        build_time = None if start is None or build_start is None else start - build_start
+        spawn_time = None
+        try:
+            async with _async_render_semaphore():
+                proc = await asyncio.create_subprocess_exec(*args, stdin=subprocess.DEVNULL,
+                                                            stdout=subprocess.PIPE,
+                                                            stderr=subprocess.PIPE)
+                if start is not None:
+                    spawn_time = time.perf_counter() - start
+                try:
+                    stdout, stderr = await asyncio.wait_for(proc.communicate(),
+                                                            timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    raise subprocess.TimeoutExpired(args, self.timeout)
+                finally:
+                    if proc.returncode is None:
+                        proc.kill()
+                        await proc.wait()
+            stdout = stdout.decode('utf-8', errors='replace')
+            stderr = stderr.decode('utf-8', errors='replace')
+            # Catch error from stderr and raise it
+            if proc.returncode != 0:
+                raise ChildProcessError(stderr)
+        except (ChildProcessError, subprocess.TimeoutExpired) as err:
+            if start is not None:
+                _emit_run_event(RunEvent(len(cmd), build_time, spawn_time, None,
+                                         time.perf_counter() - start, proc.returncode,
+                                         len(str(err)), _output_size(outputs), False, err))
+            raise
+        if start is not None:
+            _emit_run_event(RunEvent(len(cmd), build_time, spawn_time, None,
+                                     time.perf_counter() - start, proc.returncode, len(stderr),
+                                     _output_size(outputs), False, None))
+        return subprocess.CompletedProcess(args, proc.returncode, stdout=stdout, stderr=stderr)
+
+    async def save_figure_async(self, filename='myfigure', filetype=None):
+        return await self.save_figures_async([self._output_target(filename, filetype)[0]])
+
+    async def save_figures_async(self, filenames):
+        build_start = time.perf_counter() if _run_hooks else None
+        targets = self._output_targets(filenames)
+        pending = self._uncached_targets(targets)
+        command = self._save_command(pending if pending else targets)
+        if not pending:
+            return command
+        if self.render_client is not None:
+            async with _async_render_semaphore():
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._save_client_targets, pending)
+            self._cache_targets(pending)
+            return command
+        await self._run_async(cmd=command, persistent=False, build_start=build_start,
+                              outputs=[self._output_path(filename) for filename, _ in pending])
+        self._cache_targets(pending)
+        return command
+
     def clear(self):
         self.__config_command = ''
-        self.__plot_command = ''
+        self.__plots.clear()
+        self.__titles.clear()
+        self.__label_counter = 1
         self.__user_command = ''
         self.__present_plots = 0
+        self.__binary_files.clear()
+        self._remove_files(self.__tempfiles)
+        self.__source_files.clear()
+        self.__pending_decimation.clear()
         self._font = None
         self._font_size = None
         self._title = None
@@ -477,8 +2299,764 @@ class Figure:
         self._axis_ranges = [None, None]
         return
 
+    def compile(self):
+        """
+        Compile the configured figure into a FigureTemplate, which renders the same plots for any
+        other datafile with the same layout. Only XY plots of Figure.datafile are supported.
+        Image plots depend on the size and values of their image, and in-memory data, decimated
+        or windowed series and other files would keep plotting the data of this figure.
+
+        @return FigureTemplate: Immutable and picklable template of the figure
+        """
+        if self._datafile is None:
+            raise ValueError('Figure.compile needs Figure.datafile to be set.')
+        if any(isinstance(plot, _ImagePlot) for plot in self.__plots):
+            raise ValueError('Figure.compile does not support image plots.')
+        if self.__tempfiles or self.__source_files or self.__pending_decimation:
+            raise ValueError('Figure.compile only supports plots of Figure.datafile, not of '
+                             'in-memory data, decimated or windowed series or other files.')
+        # Only the sources of the XY series are parameterized. Titles, labels and user commands
+        # naming the datafile are kept as they are.
+        marker = '\0'
+        fragments = self._plot_body(self._frame_plot_list(marker)).split(marker)
+        if len(fragments) < 2:
+            raise ValueError('Figure.compile needs at least one plot of Figure.datafile.')
+        return FigureTemplate(fragments, font=self.font, font_size=self.font_size,
+                              timeout=self.timeout)
+
+
+class StreamingFigure(Figure):
+    """
+    Live XY figure fed with rows of data while it is displayed.
+
+    The most recent rows are kept in a ring buffer of fixed capacity and sent to one persistent
+    gnuplot process as an inline datablock. Redraws are limited to max_fps. Rows appended while
+    a redraw is pending are coalesced into that redraw.
+    Column indices of plot_xy refer to the columns of the appended rows.
+    """
+    _DATABLOCK = '$PYGNUPLOT_STREAM'
+
+    def __init__(self, num_columns=2, capacity=10000, max_fps=10, use_default_style=False,
+                 timeout=None):
+        super().__init__(use_default_style=use_default_style, timeout=timeout,
+                         session=GnuplotSession(persist=True, reset=False))
+        if not isinstance(num_columns, int) or num_columns < 1:
+            raise ValueError('StreamingFigure.num_columns must be a positive int. Received "{0}" '
+                             'instead.'.format(num_columns))
+        if not isinstance(capacity, int) or capacity < 1:
+            raise ValueError('StreamingFigure.capacity must be a positive int. Received "{0}" '
+                             'instead.'.format(capacity))
+        self.__num_columns = num_columns
+        self.__buffer = collections.deque(maxlen=capacity)
+        self.__min_interval = 1 / max_fps if max_fps else 0
+        self.__last_draw = None
+        self.__timer = None
+        self.__error = None
+        self.__closed = False
+        self.__lock = threading.Lock()
+        # Held while gnuplot draws, so close waits for a running redraw
+        self.__draw_lock = threading.Lock()
+
+    @property
+    def num_columns(self):
+        return self.__num_columns
+
+    @property
+    def capacity(self):
+        return self.__buffer.maxlen
+
+    def __len__(self):
+        return len(self.__buffer)
+
+    def plot_xy(self, xdata_ind=0, ydata_ind=1, xerror_ind=None, yerror_ind=None, label=None,
+                xscale=1, yscale=1, data=None):
+        if data is not None or self.decimate is not None:
+            raise ValueError('StreamingFigure only plots the streamed rows without decimation.')
+        self._check_columns(self.__num_columns, xdata_ind, ydata_ind, xerror_ind, yerror_ind)
+        return super().plot_xy(xdata_ind, ydata_ind, xerror_ind=xerror_ind,
+                               yerror_ind=yerror_ind, label=label, xscale=xscale, yscale=yscale)
+
+    def plot_img(self, *args, **kwargs):
+        raise TypeError('StreamingFigure does not support image plots.')
+
+    def _source(self):
+        return self._DATABLOCK
+
+    def append(self, row):
+        """
+        Append a single row of num_columns values and schedule a redraw.
+        """
+        self.extend([row])
+        return
+
+    def extend(self, rows):
+        """
+        Append several rows of num_columns values and schedule a redraw.
+        """
+        rows = [tuple(float(value) for value in row) for row in rows]
+        for row in rows:
+            if len(row) != self.__num_columns:
+                raise ValueError('StreamingFigure rows must have {0:d} columns. Received {1:d} '
+                                 'instead.'.format(self.__num_columns, len(row)))
+        with self.__lock:
+            if self.__closed:
+                raise ValueError('StreamingFigure is closed.')
+            self._raise_error()
+            self.__buffer.extend(rows)
+            if self.__timer is not None:
+                # A redraw is already pending and will include these rows
+                return
+            now = time.monotonic()
+            if self.__last_draw is None or now - self.__last_draw >= self.__min_interval:
+                delay = 0
+            else:
+                delay = self.__min_interval - (now - self.__last_draw)
+            self.__timer = threading.Timer(delay, self.flush)
+            self.__timer.daemon = True
+            self.__timer.start()
+        return
+
+    def flush(self):
+        """
+        Send the buffered rows to gnuplot and redraw immediately. Does nothing once closed.
+        """
+        with self.__draw_lock:
+            with self.__lock:
+                if self.__timer is not None:
+                    self.__timer.cancel()
+                    self.__timer = None
+                if self.__closed:
+                    return
+                datablock = '{0} << EOD\n{1}\nEOD\n'.format(
+                    self._DATABLOCK, '\n'.join(' '.join(repr(value) for value in row)
+                                               for row in self.__buffer))
+                first_draw = self.__last_draw is None
+                self.__last_draw = time.monotonic()
+            command = datablock + (self._show_command() if first_draw else 'replot;')
+            try:
+                self.run(cmd=command, persistent=True)
+            except (ChildProcessError, subprocess.TimeoutExpired) as err:
+                with self.__lock:
+                    # Timer threads can not raise to the caller, so report on the next append
+                    self.__error = err
+                    self.__last_draw = None
+        return
+
+    def _raise_error(self):
+        if self.__error is not None:
+            err, self.__error = self.__error, None
+            raise err
+        return
+
+    def close(self):
+        """
+        Stop redrawing and close the gnuplot process. Plot windows persist until closed.
+        """
+        with self.__lock:
+            self.__closed = True
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+        with self.__draw_lock:
+            self.session.close()
+        return
+
+
+class FigureGrid(Figure):
+    """
+    Sheet of several Figures rendered as panels of a single gnuplot multiplot.
+
+    Panels are filled row by row. Every panel starts from a reset gnuplot state, so the settings
+    of one panel do not leak into the next; its origin and size on the sheet are set again after
+    the reset. Title, font and user commands of the grid apply to the whole sheet, user commands
+    are applied to every panel before its own configuration. The terminal font is the font of the
+    grid, the font of a panel is applied to its title, labels, tics and key. The grid is saved and
+    shown like a Figure.
+    """
+
+    # Fraction of the sheet height kept free for the multiplot title
+    _GRID_TITLE_HEIGHT = 0.05
+
+    def __init__(self, rows, columns, figures=(), timeout=None, session=None, render_cache=None):
+        super().__init__(use_default_style=True, timeout=timeout, session=session,
+                         render_cache=render_cache)
+        for value in (rows, columns):
+            if not isinstance(value, int) or value < 1:
+                raise ValueError('FigureGrid rows and columns must be positive ints. Received '
+                                 '"{0}" instead.'.format(value))
+        self.__layout = (rows, columns)
+        self.__panels = list()
+        for figure in figures:
+            self.add(figure)
+
+    @property
+    def layout(self):
+        return self.__layout
+
+    @property
+    def panels(self):
+        return tuple(self.__panels)
+
+    def add(self, figure):
+        """
+        Append figure as the next panel of the grid.
+        """
+        if not isinstance(figure, Figure) or isinstance(figure, FigureGrid):
+            raise TypeError('FigureGrid panels must be of type Figure. Received "{0}" instead.'
+                            ''.format(type(figure)))
+        if len(self.__panels) >= self.__layout[0] * self.__layout[1]:
+            raise ValueError('FigureGrid with layout {0:d},{1:d} is already full.'
+                             ''.format(*self.__layout))
+        self.__panels.append(figure)
+        return
+
+    def plot_xy(self, *args, **kwargs):
+        raise TypeError('Add a Figure as panel of the FigureGrid instead.')
+
+    def plot_img(self, *args, **kwargs):
+        raise TypeError('Add a Figure as panel of the FigureGrid instead.')
+
+    def _plot_body(self):
+        rows, columns = self.__layout
+        command = self._user_commands()
+        # reset drops the size and origin set by a multiplot layout, so panels are placed
+        # explicitly, below a strip kept free for the sheet title
+        command += 'set multiplot'
+        top = 1.0
+        if self.title is not None:
+            command += ' title "{0}"'.format(self.title)
+            top -= self._GRID_TITLE_HEIGHT
+        command += ';'
+        width = 1.0 / columns
+        height = top / rows
+        for index, panel in enumerate(self.__panels):
+            row, column = divmod(index, columns)
+            # Sheet wide user commands are repeated after the reset, before the panel config
+            command += 'reset;set origin {0:g},{1:g};set size {2:g},{3:g};'.format(
+                column * width, top - (row + 1) * height, width, height)
+            command += self._user_commands()
+            if panel.font and panel.font_size:
+                font_spec = ' font "{0},{1:d}"'.format(panel.font, panel.font_size)
+                for element in ('title', 'xlabel', 'ylabel', 'cblabel', 'tics', 'key'):
+                    command += 'set {0}{1};'.format(element, font_spec)
+            if panel._datadir:
+                command += 'cd "{0}";'.format(panel._datadir)
+            command += panel._plot_body()
+        command += 'unset multiplot;'
+        return command
+
+    def _save_command(self, targets):
+        # replot only repeats the last panel, so the whole multiplot is issued for every target.
+        # Panels change directory, so output files are given as absolute paths.
+        command = ''
+        for filename, filetype in targets:
+            command += self._terminal_command(filetype)
+            command += 'set output "{0}";'.format(
+                os.path.abspath(self._output_path(filename)).replace('\\', '/'))
+            command += self._plot_body()
+        command += 'unset output;'
+        return command
+
+    def _data_files(self):
+        files, tempfiles = super()._data_files()
+        for panel in self.__panels:
+            panel_files, panel_tempfiles = panel._data_files()
+            files += panel_files
+            tempfiles += panel_tempfiles
+        return files, tempfiles
+
+
+class FigureTemplate:
+    """
+    Immutable, compiled form of a configured Figure, created by Figure.compile.
+
+    The command string of the figure is rendered once and split wherever an XY series reads the
+    datafile, so binding another datafile only joins the pieces again. Templates can be pickled and sent to
+    worker processes.
+    """
+    __slots__ = ('_fragments', '_font', '_font_size', '_timeout')
+
+    def __init__(self, fragments, font=None, font_size=None, timeout=None):
+        """
+        @param tuple fragments: Plot body split at every occurrence of the datafile
+        """
+        object.__setattr__(self, '_fragments', tuple(fragments))
+        object.__setattr__(self, '_font', font)
+        object.__setattr__(self, '_font_size', font_size)
+        object.__setattr__(self, '_timeout', timeout)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('FigureTemplate is immutable.')
+
+    def __reduce__(self):
+        return (FigureTemplate, (self._fragments, self._font, self._font_size, self._timeout))
+
+    @property
+    def font(self):
+        return self._font
+
+    @property
+    def font_size(self):
+        return self._font_size
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def body(self, datafile):
+        """
+        @param str datafile: Name of the datafile as gnuplot sees it after changing into its folder
+        @return str: Plot body reading datafile
+        """
+        return '"{0}"'.format(datafile).join(self._fragments)
+
+    def bind(self, datafile, session=None, render_cache=None, render_client=None):
+        """
+        Create a Figure plotting datafile with this template. It is saved, shown and rendered
+        like the Figure the template was compiled from.
+
+        @param str datafile: Path to the datafile
+        @return Figure: Figure bound to datafile
+        """
+        figure = _TemplateFigure(self, datafile, session=session, render_cache=render_cache)
+        figure.render_client = render_client
+        return figure
+
+
+class _TemplateFigure(Figure):
+    # Figure whose plot body comes from a FigureTemplate
+
+    def __init__(self, template, datafile, session=None, render_cache=None):
+        super().__init__(datafile=datafile, use_default_style=True, timeout=template.timeout,
+                         session=session, render_cache=render_cache)
+        self.__template = template
+        self._font = template.font
+        self._font_size = template.font_size
+
+    @property
+    def template(self):
+        return self.__template
+
+    def plot_xy(self, *args, **kwargs):
+        raise TypeError('Figures bound to a FigureTemplate can not be changed.')
+
+    def plot_img(self, *args, **kwargs):
+        raise TypeError('Figures bound to a FigureTemplate can not be changed.')
+
+    def _plot_body(self):
+        return self.__template.body(self._datafile)
+
+    def compile(self):
+        return self.__template
+
+    def _data_files(self):
+        return [self.datafile], list()
+
+
+# Outcome of rendering a single figure with render_batch
+RenderResult = collections.namedtuple('RenderResult',
+                                      ['figure', 'output', 'command', 'elapsed', 'error'])
+
+
+def render_batch(figures, outputs, max_workers=None, use_sessions=True):
+    """
+    Save many independent figures concurrently on a pool of gnuplot workers.
+
+    Every worker thread drives its own gnuplot process (a GnuplotSession unless use_sessions is
+    False or the figure has its own session attached). A failing or timed out figure is reported
+    in its result and does not stop the rest of the batch.
+
+    @param iterable figures: Figure objects to save
+    @param iterable outputs: One filename or list of filenames (see Figure.save_figures) per figure
+    @param int max_workers: Number of concurrent gnuplot workers. Defaults to the number of CPUs.
+    @param bool use_sessions: Keep one gnuplot process per worker alive for the whole batch
+    @return list: RenderResult for every figure in input order
+    """
+    figures = list(figures)
+    outputs = list(outputs)
+    if len(figures) != len(outputs):
+        raise ValueError('render_batch needs one output per figure. Received {0:d} figures and '
+                         '{1:d} outputs.'.format(len(figures), len(outputs)))
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    worker_state = threading.local()
+    sessions = list()
+    sessions_lock = threading.Lock()
+
+    def render(figure, output):
+        start = time.perf_counter()
+        command = None
+        try:
+            targets = figure._uncached_targets(figure._output_targets(output))
+            if not targets:
+                return RenderResult(figure, output, None, time.perf_counter() - start, None)
+            command = figure._save_command(targets)
+            session = None
+            if use_sessions and figure.session is None:
+                session = getattr(worker_state, 'session', None)
+                if session is None:
+                    session = worker_state.session = GnuplotSession(persist=False)
+                    with sessions_lock:
+                        sessions.append(session)
+            figure._run(cmd=command, persistent=False, build_start=start, session=session,
+                        outputs=[figure._output_path(filename) for filename, _ in targets])
+            figure._cache_targets(targets)
+        except Exception as err:
+            return RenderResult(figure, output, command, time.perf_counter() - start, err)
+        return RenderResult(figure, output, command, time.perf_counter() - start, None)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(render, figures, outputs))
+    finally:
+        for session in sessions:
+            session.close()
+    return results
+
+
+def _send_message(connection, header, payload=b''):
+    # Messages are a JSON header and a binary payload, each preceded by its length
+    encoded = json.dumps(header).encode('utf-8')
+    connection.sendall(struct.pack('>II', len(encoded), len(payload)) + encoded + payload)
+    return
+
+
+def _receive_exactly(connection, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError('Connection closed after {0:d} of {1:d} bytes.'.format(
+                len(data), size))
+        data += chunk
+    return bytes(data)
+
+
+def _receive_message(connection):
+    header_size, payload_size = struct.unpack('>II', _receive_exactly(connection, 8))
+    header = json.loads(_receive_exactly(connection, header_size).decode('utf-8'))
+    return header, _receive_exactly(connection, payload_size)
+
+
+class _RenderJob:
+    __slots__ = ('command', 'timeout', 'done', 'output', 'error')
+
+    def __init__(self, command, timeout):
+        self.command = command
+        self.timeout = timeout
+        self.done = threading.Event()
+        self.output = None
+        self.error = None
+
+
+class RenderServer:
+    """
+    Render daemon keeping a pool of warm gnuplot workers behind a Unix domain socket.
+
+    Clients (see RenderClient) send the command strings describing a figure and receive the
+    rendered file content. Jobs wait in a bounded queue. If it stays full for queue_timeout
+    seconds the job is rejected, so clients feel the backpressure instead of piling up work.
+    A job exceeding its timeout kills its gnuplot worker, which is restarted for the next job.
+    Workers are replaced after max_jobs_per_worker jobs.
+
+    Clients can run any gnuplot command, so the socket is only accessible by the current user.
+    """
+
+    def __init__(self, socket_path, workers=None, queue_size=64, timeout=60, queue_timeout=10,
+                 max_jobs_per_worker=1000):
+        """
+        @param str socket_path: Path of the Unix domain socket to listen on
+        @param int workers: Number of gnuplot workers. Defaults to the number of CPUs.
+        @param int queue_size: Maximum number of jobs waiting for a worker
+        @param float timeout: Default timeout per job in seconds
+        @param float queue_timeout: Seconds a job may wait for a free queue slot
+        @param int max_jobs_per_worker: Restart a worker's gnuplot process after this many jobs
+        """
+        if not isinstance(queue_size, int) or queue_size < 1:
+            raise ValueError('RenderServer.queue_size must be a positive int. Received "{0}" '
+                             'instead.'.format(queue_size))
+        if not isinstance(max_jobs_per_worker, int) or max_jobs_per_worker < 1:
+            raise ValueError('RenderServer.max_jobs_per_worker must be a positive int. Received '
+                             '"{0}" instead.'.format(max_jobs_per_worker))
+        self.__socket_path = socket_path
+        self.__num_workers = (os.cpu_count() or 1) if workers is None else int(workers)
+        self.__timeout = timeout
+        self.__queue_timeout = queue_timeout
+        self.__max_jobs_per_worker = max_jobs_per_worker
+        self.__jobs = queue.Queue(maxsize=queue_size)
+        self.__workers = list()
+        self.__sessions = dict()
+        self.__socket = None
+        self.__running = False
+        self.__start_time = None
+        self.__stats_lock = threading.Lock()
+        self.__counters = collections.Counter()
+        self.__output_dir = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        return False
+
+    @property
+    def socket_path(self):
+        return self.__socket_path
+
+    def start(self):
+        """
+        Start the gnuplot workers and bind the socket. Call serve_forever to accept clients.
+        """
+        if self.__running:
+            return
+        try:
+            if not stat.S_ISSOCK(os.stat(self.__socket_path).st_mode):
+                raise FileExistsError('RenderServer.socket_path "{0}" exists and is not a socket.'
+                                      ''.format(self.__socket_path))
+            # Left behind by a server that did not shut down
+            os.remove(self.__socket_path)
+        except FileNotFoundError:
+            pass
+        self.__output_dir = tempfile.mkdtemp(prefix='pygnuplot_server_')
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            self.__socket.bind(self.__socket_path)
+        finally:
+            os.umask(old_umask)
+        self.__socket.listen()
+        self.__running = True
+        self.__start_time = time.monotonic()
+        for index in range(self.__num_workers):
+            worker = threading.Thread(target=self._work, args=(index,), daemon=True)
+            worker.start()
+            self.__workers.append(worker)
+        _logger.info('Render server listening on %s with %d workers', self.__socket_path,
+                     self.__num_workers)
+        return
+
+    def serve_forever(self):
+        """
+        Accept clients until shutdown is called. Every connection is handled in its own thread.
+        """
+        self.start()
+        while self.__running:
+            try:
+                connection, _ = self.__socket.accept()
+            except OSError:
+                # The socket was closed by shutdown
+                break
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+        return
+
+    def shutdown(self):
+        """
+        Stop accepting clients, finish the queued jobs and close all gnuplot workers.
+        """
+        if not self.__running:
+            return
+        self.__running = False
+        # Closing alone does not wake up a thread blocked in accept on Linux
+        try:
+            self.__socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.__socket.close()
+        for _ in self.__workers:
+            self.__jobs.put(None)
+        for worker in self.__workers:
+            worker.join()
+        self.__workers = list()
+        if os.path.exists(self.__socket_path):
+            os.remove(self.__socket_path)
+        shutil.rmtree(self.__output_dir, ignore_errors=True)
+        return
+
+    def stats(self):
+        """
+        @return dict: Job counters, queue length, worker restarts and uptime of the server
+        """
+        with self.__stats_lock:
+            stats = {name: self.__counters[name] for name in
+                     ('submitted', 'rejected', 'completed', 'failed', 'timeouts', 'recycled')}
+            stats['restarts'] = sum(session.restarts for session in self.__sessions.values())
+        stats['workers'] = self.__num_workers
+        stats['queued'] = self.__jobs.qsize()
+        stats['queue_size'] = self.__jobs.maxsize
+        stats['uptime'] = 0 if self.__start_time is None else time.monotonic() - self.__start_time
+        return stats
+
+    def _count(self, name):
+        with self.__stats_lock:
+            self.__counters[name] += 1
+        return
+
+    def _handle(self, connection):
+        with connection:
+            try:
+                request, _ = _receive_message(connection)
+                if request.get('op') == 'stats':
+                    _send_message(connection, {'ok': True, 'stats': self.stats()})
+                    return
+                if request.get('op') != 'render':
+                    _send_message(connection, {'ok': False, 'error': 'ValueError',
+                                               'message': 'Unknown operation "{0}".'.format(
+                                                   request.get('op'))})
+                    return
+                job = _RenderJob(request['command'], request.get('timeout') or self.__timeout)
+                try:
+                    self.__jobs.put(job, timeout=self.__queue_timeout)
+                except queue.Full:
+                    self._count('rejected')
+                    _send_message(connection, {'ok': False, 'error': 'ServerBusy',
+                                               'message': 'Render queue is full.'})
+                    return
+                self._count('submitted')
+                job.done.wait()
+                if job.error is not None:
+                    _send_message(connection, {'ok': False, 'error': type(job.error).__name__,
+                                               'message': str(job.error)})
+                else:
+                    _send_message(connection, {'ok': True}, job.output)
+            except (OSError, ValueError, KeyError) as err:
+                _logger.warning('Dropped render server request: %s', err)
+        return
+
+    def _work(self, index):
+        session = None
+        num_jobs = 0
+        output_path = os.path.join(self.__output_dir, 'worker_{0:d}.out'.format(index)).replace(
+            '\\', '/')
+        while True:
+            job = self.__jobs.get()
+            if job is None:
+                break
+            if session is None:
+                session = GnuplotSession(persist=False)
+                with self.__stats_lock:
+                    self.__sessions[index] = session
+            try:
+                session.run('set output "{0}";{1}unset output;'.format(output_path, job.command),
+                            timeout=job.timeout)
+                with open(output_path, 'rb') as file:
+                    job.output = file.read()
+                self._count('completed')
+            except subprocess.TimeoutExpired as err:
+                # session.run killed the hung gnuplot process already
+                job.error = err
+                self._count('timeouts')
+            except Exception as err:
+                job.error = err
+                self._count('failed')
+            finally:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                job.done.set()
+            num_jobs += 1
+            if num_jobs >= self.__max_jobs_per_worker:
+                session.close()
+                session = None
+                num_jobs = 0
+                self._count('recycled')
+        if session is not None:
+            session.close()
+        return
+
+
+class RenderClient:
+    """
+    Client of a RenderServer. Assign it to Figure.render_client to render figures on the server.
+
+    Data is not copied. The server reads the datafiles of the figure from the shared filesystem,
+    so the figure must stay alive until rendering finished.
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        """
+        @param str socket_path: Path of the Unix domain socket the server listens on
+        @param float timeout: Timeout for a job in seconds. Defaults to the timeout of the figure
+                              and then to the one of the server.
+        """
+        self.__socket_path = socket_path
+        self.__timeout = timeout
+
+    @property
+    def socket_path(self):
+        return self.__socket_path
+
+    def render(self, figure, filetype='png'):
+        """
+        Render figure on the server.
+
+        @param Figure figure: Figure to render
+        @param str filetype: Any filetype supported by Figure.save_figure
+        @return bytes: Content of the rendered file
+        """
+        filetype = filetype.lower()
+        command = figure._terminal_command(filetype)
+        if figure._datadir:
+            command += 'cd "{0}";'.format(figure._datadir)
+        command += figure._plot_body()
+        timeout = self.__timeout if self.__timeout is not None else figure.timeout
+        response, output = self._request({'op': 'render', 'command': command,
+                                           'timeout': timeout})
+        if response['ok']:
+            return output
+        if response['error'] == 'TimeoutExpired':
+            raise subprocess.TimeoutExpired(command, timeout, stderr=response['message'])
+        if response['error'] == 'ServerBusy':
+            raise ConnectionRefusedError(response['message'])
+        raise ChildProcessError(response['message'])
+
+    def stats(self):
+        """
+        @return dict: Statistics of the server, see RenderServer.stats
+        """
+        return self._request({'op': 'stats'})[0]['stats']
+
+    def _request(self, header):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(self.__socket_path)
+            _send_message(connection, header)
+            return _receive_message(connection)
+
+
+def serve(argv=None):
+    """
+    Command line entry point of the render server: python pygnuplot.py serve --socket PATH
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog='pygnuplot serve',
+                                     description='Render figures for RenderClient connections.')
+    parser.add_argument('--socket', required=True, help='Path of the Unix domain socket')
+    parser.add_argument('--workers', type=int, help='Number of gnuplot workers')
+    parser.add_argument('--queue-size', type=int, default=64, help='Maximum queued jobs')
+    parser.add_argument('--timeout', type=float, default=60, help='Default job timeout [s]')
+    parser.add_argument('--queue-timeout', type=float, default=10,
+                        help='Seconds a job may wait for a free queue slot')
+    parser.add_argument('--max-jobs', type=int, default=1000,
+                        help='Restart a gnuplot worker after this many jobs')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    server = RenderServer(args.socket, workers=args.workers, queue_size=args.queue_size,
+                          timeout=args.timeout, queue_timeout=args.queue_timeout,
+                          max_jobs_per_worker=args.max_jobs)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+    return 0
+
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['serve']:
+        sys.exit(serve(sys.argv[2:]))
+
     import numpy as np
 
     # Create example data for XY plot
@@ -507,12 +3085,10 @@ if __name__ == "__main__":
     a.ylabel = 'amplitude'
     a.xrange = [data[0, 0] - 0.1, data[0, -1] + 0.1]
     a.yrange = [1.2 * data[3].min(), 1.2 * data[3].max()]
-    a.plot_xy(1, 2, xerror_ind=5, yerror_ind=6, label='plottery 1')
-    a.plot_xy(1, 3, xerror_ind=5, yerror_ind=6, label='plottery 2')
-    a.plot_xy(1, 4, xerror_ind=5, yerror_ind=6)
-    a.save_figure('testfig.png')
-    a.save_figure('testfig.svg')
-    a.save_figure('testfig.pdf')
+    a.plot_xy(0, 1, xerror_ind=4, yerror_ind=5, label='plottery 1')
+    a.plot_xy(0, 2, xerror_ind=4, yerror_ind=5, label='plottery 2')
+    a.plot_xy(0, 3, xerror_ind=4, yerror_ind=5)
+    a.save_figures(['testfig.png', 'testfig.svg', 'testfig.pdf'])
     a.show()
 
     # Plot image
@@ -526,8 +3102,6 @@ if __name__ == "__main__":
     a.yrange = [100, 200]
     a.plot_img(colorbar_label='counts/s')
     a.show()
-    a.save_figure('testfig.png')
-    a.save_figure('testfig.svg')
-    a.save_figure('testfig.pdf')
+    a.save_figures(['testfig.png', 'testfig.svg', 'testfig.pdf'])
 
 